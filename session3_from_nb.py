@@ -29,7 +29,7 @@
 # + pretty printing numbers
 # + a function that acts like a judge
 # 
-# The output of this notebook generates a data frame that it exports to Stata, including the variable labels. 
+# The output of this notebook generates a data frame that it exports to Parquet, and optionally to Stata, including the variable labels. 
 # 
 # ---
 
@@ -93,18 +93,57 @@ print(fname)
 # 
 # Normally you can use the command `df = pd.read_csv(fname)`, but that generates an ugly error message.
 # 
-# Instead I use: 
+# The file is also very wide: it has thousands of columns, which makes the standard `pd.read_csv` slow. Instead I use a small helper function that tells `pd.read_csv` to use the [PyArrow](https://arrow.apache.org/docs/python/csv.html) engine (`engine='pyarrow'`), which uses all cores of your PC: 
 
 # In[ ]:
 
 
-df = pd.read_csv(fname, sep='^', encoding = "ISO-8859-1", low_memory=False)
+import zipfile
+from functools import lru_cache
+
+@lru_cache(maxsize=2)  # remember the frame, so the file is parsed only once
+def _read_bhcf(fname, use_threads=True):
+    cache = os.path.splitext(fname)[0] + '.feather'  # e.g. BHCF20201231.feather
+    if os.path.exists(cache):  # parsed before: load the columnar copy, no parsing needed
+        return pd.read_feather(cache, dtype_backend='pyarrow')
+    with zipfile.ZipFile(fname) as zf:  # peek at the header: which columns do we need?
+        with zf.open(zf.namelist()[0]) as fh:
+            header = fh.readline().decode('ISO-8859-1').rstrip('\r\n').split('^')
+    usecols = [x for x in header if x.startswith(('RSSD', 'TEXT', 'BHCK'))]
+    df = pd.read_csv(fname, sep='^', encoding='ISO-8859-1', usecols=usecols,
+                     engine='pyarrow' if use_threads else 'c',  # the 'c' engine uses a single core
+                     dtype_backend='pyarrow')
+    df.to_feather(cache)  # save a Feather copy for the next run
+    return df
+
+df = _read_bhcf(fname, use_threads=True)
 
 
 # Which aknowledges the funny separator (^) the FED uses as a field separator, the file encoding, and the fact that it is a big file. 
 # 
 # We do not have to worry about the fact that the file is compressed (zip). 
 # 
+# The helper only keeps the columns we use in this session, i.e. the ones starting with `RSSD`, `TEXT`, or `BHCK`. The reader skips all other columns, which saves time and memory.
+# 
+# The first time you run the cell, the helper also saves the data in [Feather](https://arrow.apache.org/docs/python/feather.html) format (`BHCF20201231.feather`), next to the zip file. Next time, it loads that file instead, which is much faster than reading the csv file again.
+# 
+# If you only need a handful of columns, [Polars](https://pola.rs/) is an even faster alternative to Pandas. Its csv reader is written in Rust, uses all cores, and only parses the columns you ask for. Polars cannot open the zip file itself, so I hand it the unzipped bytes. `to_pandas()` converts the result back to a Pandas data frame.
+# 
+# Polars is not part of the standard Anaconda installation (`pip install polars`), so I switch this off (`use_polars = False`):
+
+# In[ ]:
+
+
+use_polars = False
+if use_polars:
+    import polars as pl
+    with zipfile.ZipFile(fname) as zf:
+        raw = zf.read(zf.namelist()[0])
+    df_small = pl.read_csv(raw, separator='^', encoding='utf8-lossy', low_memory=True,
+                           columns=['RSSD9001', 'RSSD9999', 'BHCK2170', 'BHCK3210']).to_pandas()
+    print(df_small.head())
+
+
 # ---
 
 # Very basic string manipulations:
@@ -161,15 +200,56 @@ print(nrows)
 
 
 # ---
-# Count the number of valid observations for Total Assets (BHCK2170)
+# Count the number of valid observations for Total Assets (BHCK2170). 
+# 
+# I also need the minimum and maximum values later on, so I compute the three statistics in a single pass over the column. 
+# 
+# For this I use a small function that is compiled to machine code by [Numba](https://numba.pydata.org/) (`@njit`). It skips the empty cells (NaNs) and is much faster than the Pandas functions `count()`, `min()`, and `max()`:
 
 # In[ ]:
 
 
-n_of_ta = df['BHCK2170'].count()
+from numba import njit
+
+@njit(cache=True)
+def nan_stats(a):
+    mi = np.inf
+    ma = -np.inf
+    c = 0
+    for v in a:
+        if np.isnan(v):
+            continue
+        c += 1
+        if v < mi:
+            mi = v
+        if v > ma:
+            ma = v
+    return mi, ma, c
+
+mi, ma, c = nan_stats(df['BHCK2170'].to_numpy(dtype='float64', na_value=np.nan))
+ta_stats = {'count': c, 'min': mi, 'max': ma}
+n_of_ta = int(ta_stats['count'])
 print(n_of_ta)
 
 
+# What if a file is too big to fit in the memory of your PC? Then you can read it in chunks, e.g. of 200,000 rows, and only the column you need. You compute the statistics per chunk and then combine them. 
+# 
+# Our file fits in memory, so I switch this off (`big_file = False`):
+
+# In[ ]:
+
+
+def chunked_stats(fname, column, chunksize=200_000):
+    chunks = pd.read_csv(fname, sep='^', encoding="ISO-8859-1", usecols=[column], chunksize=chunksize)
+    stats = pd.DataFrame([c[column].agg(['count', 'min', 'max']) for c in chunks])  # one row per chunk
+    return {'count': int(stats['count'].sum()), 'min': stats['min'].min(), 'max': stats['max'].max()}
+
+big_file = False
+if big_file:
+    ta_stats = chunked_stats(fname, 'BHCK2170')
+    print(ta_stats)
+
+
 # ---
 # #### My first **tuple**: `coordinate`.
 
@@ -219,14 +299,14 @@ df.shape[1]
 # In[ ]:
 
 
-max_ta = df['BHCK2170'].max()
+max_ta = ta_stats['max']
 max_ta
 
 
 # In[ ]:
 
 
-min_ta = df['BHCK2170'].min()
+min_ta = ta_stats['min']
 min_ta
 
 
@@ -261,7 +341,7 @@ min_ta
 # In[ ]:
 
 
-min_ta = df['BHCK2170'].min()  # Obain again the minimum value for Total Assets:
+min_ta = ta_stats['min']  # Obain again the minimum value for Total Assets:
 print(min_ta)
 min_ta /= 1000
 print('Minumum valube of Total assets, in millions: ${:,.2f}'.format(min_ta))
@@ -322,13 +402,13 @@ min_ta ** 0.5  # square root
 
 
 # ---
-# #### My first **boolean** variable: `low_mem`.
+# #### My first **boolean** variable: `use_threads`.
 
 # In[ ]:
 
 
-low_mem = False
-df = pd.read_csv(fname, sep='^', encoding = "ISO-8859-1", low_memory=low_mem)
+use_threads = True
+df = _read_bhcf(fname, use_threads=use_threads)  # served from the cache, the file is not parsed again
 
 
 # Note that the result of `ncols == nrows` in the if-statement below is a boolean:
@@ -354,14 +434,17 @@ verdict = "Innocent" if not guilty else "Guilty"
 print(verdict)
 
 
-# Let's write a function and play judge:
+# Let's write a function and play judge. 
+# 
+# Instead of an if-statement, the function uses the fact that `False` and `True` behave like 0 and 1, and picks the verdict from a tuple:
 
 # In[ ]:
 
 
+_VERDICTS = ('The defendant is innocent', 'The defendant is guilty')  # False -> 0, True -> 1
+
 def judge(guilty_or_not):
-    verdict = "innocent" if not guilty_or_not else "guilty"
-    return 'The defendant is '+verdict
+    return _VERDICTS[bool(guilty_or_not)]
     
 judge(True)
 
@@ -397,32 +480,39 @@ else:
 # ---
 # #### My first **datetime** variabele: `datadate`
 # 
-# To work with date variables, please import the datetime library first:
+# To work with date variables, please import the datetime library first.
+# 
+# The FED writes dates as 'YYYYMMDD', e.g. '20201231'. Since the format is fixed, I simply slice the string into year, month, and day, and build the date from these numbers. This skips the format parsing of `datetime.strptime` altogether:
 
 # In[ ]:
 
 
 from datetime import datetime
 
+@lru_cache(maxsize=None)  # dates repeat a lot in panel data: convert each date string only once
+def _parse_yyyymmdd(s):
+    return datetime(int(s[:4]), int(s[4:6]), int(s[6:8]))  # '20201231' -> 2020, 12, 31
+
 
 # In[ ]:
 
 
 datadate = df['RSSD9999'].max()
 print(datadate)
+datadate = _parse_yyyymmdd(str(datadate))  # Turn into a string, then convert to a datetime variable
+print(datadate)
 
 
 # In[ ]:
 
 
-datadate = df['RSSD9999'].min()
-print(datadate)
-datadate = str(datadate)  # Turn into a string
-print(datadate)
-datadate = datetime.strptime(datadate, '%Y%m%d')  # Convert to a datetime variable
+dates = pd.to_datetime(df['RSSD9999'].astype(str), format='%Y%m%d')  # Convert the whole column to datetime values
+datadate = dates.min()
 print(datadate)
 
 
+# Pandas converts the entire column in one go. Because all rows share the same reporting date, Pandas converts that date only once: by default, `to_datetime` converts each distinct value once and reuses the result.
+# 
 # Once a datetime variable, Python can properly work with it:
 
 # In[ ]:
@@ -437,19 +527,26 @@ datadate.strftime('%m-%d-%Y')  # String from time
 datadate.strftime('%d %m %y')  # String from time
 
 
-# Extract year, month, day, quarter
+# Extract year, month, day, quarter. 
+# 
+# You can use `datadate.year`, `datadate.month`, etc. But the FED stores the date as a number, e.g. 20201231. For such a number we do not need the datetime library at all: integer division (`//`) and the remainder (`%`) do the job. `divmod` returns both in one go:
 
 # In[ ]:
 
 
-print(f"Year: {datadate.year}")
-print(f"Month: {datadate.month}")
-print(f"Day: {datadate.day}")
-print(f"Quarter: {(datadate.month-1)//3+1}")
+d_int = int(df['RSSD9999'].min())
+year, rest = divmod(d_int, 10000)  # 2020, 1231
+month, day = divmod(rest, 100)     # 12, 31
+print(f"Year: {year}")
+print(f"Month: {month}")
+print(f"Day: {day}")
+print(f"Quarter: {(month-1)//3+1}")
 
 
 # ---
-# More flexible is the use of `parser`, which copes with most date formats:
+# More flexible is the use of `parser`, which copes with most date formats. 
+# 
+# It is, however, much slower than `datetime.strptime`. So, if you know the format of your dates, use `strptime`:
 
 # In[ ]:
 
@@ -692,12 +789,16 @@ print(x)
 
 
 # ---
-# Select from the data frame the variables that contain text:
+# Select from the data frame the variables that contain text.
+# 
+# The data frame has thousands of columns. Instead of a list comprehension, I let NumPy check all column names in one go, using `np.char.startswith()`. This returns a boolean mask (True/False for each column), which I use to select the column names:
 
 # In[ ]:
 
 
-text_cols = [x for x in df if x.startswith('TEXT')]
+cols = df.columns.values.astype(str)  # the column names as a NumPy array of strings
+is_text = np.char.startswith(cols, 'TEXT')
+text_cols = cols[is_text].tolist()
 print(len(text_cols))
 print()
 print(text_cols[::10])
@@ -708,18 +809,19 @@ print(text_cols[::10])
 # In[ ]:
 
 
-rssd_cols = [x for x in df if x.startswith('RSSD')]
+is_rssd = np.char.startswith(cols, 'RSSD')
+rssd_cols = cols[is_rssd].tolist()
 print(len(rssd_cols))
 print()
 print(rssd_cols[::5])
 
 
-# Selecting all other column names:
+# Selecting all other column names. These are the columns that are neither in `text_cols` nor in `rssd_cols`. The column index of a data frame supports set operations, so I take the difference (`sort=False` keeps the original column order):
 
 # In[ ]:
 
 
-bhc_cols = [x for x in df if not x.startswith('RSSD') and not x.startswith('TEXT')]
+bhc_cols = df.columns.difference(text_cols + rssd_cols, sort=False).tolist()
 print(len(bhc_cols))
 print()
 print(bhc_cols[::100])
@@ -730,7 +832,9 @@ print(bhc_cols[::100])
 # In[ ]:
 
 
-[int(x[-4:]) for x in rssd_cols if x.endswith('9')]
+idx = pd.Index(rssd_cols)
+mask = idx.str.endswith('9')
+idx[mask].str[-4:].astype('int32').to_numpy()  # slice and convert all names in one go
 
 
 # ---
@@ -877,7 +981,12 @@ print(months)
 # In[ ]:
 
 
-monts_dict = dict(zip(month_num, months))
+def zipdict(keys, values):
+    d = {}
+    d.update(zip(keys, values))  # fill the dictionary with the key-value pairs from both lists
+    return d
+
+monts_dict = zipdict(month_num, months)
 monts_dict
 
 
@@ -912,15 +1021,29 @@ df[var].head(10)
 # In[ ]:
 
 
-bhc_dict = dict(zip(var, labels))
+bhc_dict = zipdict(var, labels)
 bhc_dict
 
 
 # ---
-# We can now export these four variables to Stata, including the lables.
+# We can now export these four variables. 
+# 
+# I prefer the [Parquet](https://parquet.apache.org/) format: it stores the data by column and compressed, so the file is small and quick to write and read. 
+
+# In[ ]:
+
+
+df[var].to_parquet('my_first_output.parquet', compression='snappy', index=False)
+
+
+# If you need the data in Stata, set `to_stata` to `True`. The Stata file includes the lables. 
+# 
+# Stata does not understand the Arrow data types of our data frame, so I convert them to regular Pandas types first.
 
 # In[ ]:
 
 
-df[var].to_stata('my_first_stata_output.dta', write_index=False, version=114, variable_labels=bhc_dict)
+to_stata = False
+if to_stata:
+    df[var].convert_dtypes(dtype_backend='numpy_nullable').to_stata('my_first_stata_output.dta', write_index=False, version=114, variable_labels=bhc_dict)
 
@@ -32,7 +32,7 @@
 # 
 # This data shows how your community is moving around differently due to [COVID-19](https://www.google.com/covid19/mobility/). The data is available via this [link](https://www.gstatic.com/covid19/mobility/Global_Mobility_Report.csv).
 # 
-# Downloading takes some time, as it is big. We save the data to disk, compressed, to save space.
+# Downloading takes some time, as it is big. We save the data to disk, in the compressed [Parquet](https://parquet.apache.org/) format, to save space.
 
 # **Let's start!**
 
@@ -43,28 +43,44 @@ import pandas as pd
 import numpy as np
 
 
-# Normally you need not set the low_memory option to False, but hey, this is big data!
+# This is big data! So I ask Pandas to use the fast [PyArrow](https://arrow.apache.org/docs/python/csv.html) csv reader (`engine='pyarrow'`), which uses all cores of your PC.
+# 
+# I also tell Pandas that the `date` column contains dates, and in which format (`parse_dates` and `date_format`). Pandas then converts the dates while it reads the file, which is much faster than converting them afterwards.
+# 
+# Finally, I tell Pandas which data types to use (`dtype`). The mobility numbers are percentages between -100 and a few hundred, so we do not need the default 64-bit precision: 32 bits (`float32`) halve the memory use. The region names repeat a lot, so I store them as `category`.
 
 # In[ ]:
 
 
-df = pd.read_csv('https://www.gstatic.com/covid19/mobility/Global_Mobility_Report.csv', low_memory=False)
+pct_cols = ['retail_and_recreation_percent_change_from_baseline',
+            'grocery_and_pharmacy_percent_change_from_baseline',
+            'parks_percent_change_from_baseline',
+            'transit_stations_percent_change_from_baseline',
+            'workplaces_percent_change_from_baseline',
+            'residential_percent_change_from_baseline']
+dtypes = {x: 'float32' for x in pct_cols}
+dtypes.update({'sub_region_1': 'category', 'sub_region_2': 'category'})
+
+df = pd.read_csv('https://www.gstatic.com/covid19/mobility/Global_Mobility_Report.csv', engine='pyarrow',
+                 parse_dates=['date'], date_format='%Y-%m-%d', dtype=dtypes)
 
 
 # Let's save the data, compressed, and ignore the index for now. I will come back to indexes shortly.
+# 
+# I use Parquet rather than a zipped csv file: Parquet stores the data column by column in a binary format. The file is smaller, and reading it back is many times faster, because Pandas does not have to parse text.
 
 # In[ ]:
 
 
-df.to_csv('Global_Mobility_Report.csv.zip', compression='zip', index=False)
+df.to_parquet('Global_Mobility_Report.parquet', compression='snappy', index=False)
 
 
-# We can read the data using the follwing command. No need to unzip the zip file.
+# We can read the data using the follwing command. 
 
 # In[ ]:
 
 
-df = pd.read_csv('Global_Mobility_Report.csv.zip', low_memory=False)
+df = pd.read_parquet('Global_Mobility_Report.parquet')
 
 
 # 
@@ -134,7 +150,7 @@ print(f'Shape {df.shape}, rows: {df.shape[0]}, columns: {df.shape[1]}')
 # - The column names look awful, we will change that.
 # - The leftmost column is the index. The index here is not meaningful. But we will make a habit of using the index. It is an extremely powerful feature of Pandas! 
 # - The number of observations is large: > 8 million. To make our life easy, we will keep only a few countries. 
-# - The date column is a float, we should turn that in a date variable.
+# - The date column is a proper date variable, because we parsed it when reading the data.
 # - There are observations called NaN, these are empty cells, and we will learn how to manage them. 
 
 # In[ ]:
@@ -175,6 +191,29 @@ list(df)
 
 
 
+# **Answer**: String methods return a new string, so we can chain them: first get rid of `_percent_change_from_baseline`, then of the underscores, then of leading and lagging spaces, and finally capitalize. This way we walk over the column names only once. (Running it again on the new names changes nothing, because there is nothing left to remove.)
+
+# In[ ]:
+
+
+df.columns = [x.replace('_percent_change_from_baseline', '').replace('_', ' ').strip().capitalize() for x in df.columns]
+list(df)
+
+
+# ---
+# 
+# **Categories**
+# 
+# The country names and codes repeat millions of times. Pandas can store such columns as a `category`: each distinct name is stored only once, and every row holds a small integer code that refers to it. This saves a lot of memory, and comparisons such as `df['Country region']=="New Zealand"` become fast comparisons of integers.
+
+# In[ ]:
+
+
+df['Country region code'] = df['Country region code'].astype('category')
+df['Country region'] = df['Country region'].astype('category')
+df['Country region'].cat.categories[:5]
+
+
 # ---
 # 
 # **Setting the index**
@@ -219,6 +258,15 @@ dfnz = df.loc[df['Country region']=="New Zealand"]
 dfnz.head(3)
 
 
+# The same selection with `query`, which takes the condition as a string. Column names with spaces go between backticks. Pandas hands the condition to the fast numexpr library if possible:
+
+# In[ ]:
+
+
+dfnz = df.query("`Country region` == 'New Zealand'")
+dfnz.head(3)
+
+
 # In[ ]:
 
 
@@ -275,12 +323,14 @@ dfnl.head(3)
 # 
 # **Specify columns when we select rows using the index**
 # 
-# We specify the the columns in a bracketed list:
+# We specify the the columns in a bracketed list. 
+# 
+# Note the order: first the rows ("NL"), then the columns. Writing `df[['Date','Residential']].loc["NL"]` gives the same result, but first copies the two columns for all 8 million rows, and only then selects the Dutch rows. On tall data frames, always select rows before columns.
 
 # In[ ]:
 
 
-dfnl = df[['Date','Residential']].loc["NL"]
+dfnl = df.loc["NL", ['Date','Residential']]
 dfnl.head(3)
 
 
@@ -306,21 +356,21 @@ dfnz.shape
 # 
 # We now have a much more easy to manage data frame. Let's save it. 
 # 
-# We want to keep the index, so we save the csv file without using the `index=False` parameter.
+# I save it in the [Feather](https://arrow.apache.org/docs/python/feather.html) format, which is very fast to write and read. Feather does not store an index, so I turn the index into an ordinary column first, using `reset_index()`.
 
 # In[ ]:
 
 
-dfnz.to_csv('New_Zealand_Mobility_Report.csv')
+dfnz.reset_index().to_feather('New_Zealand_Mobility_Report.feather')
 dfnz.head(3)
 
 
-# If you retrieve the csv data, you will need to set the index again, but don't worry about that for now.
+# If you retrieve the data, you will need to set the index again, but don't worry about that for now.
 
 # In[ ]:
 
 
-dfnz = pd.read_csv('New_Zealand_Mobility_Report.csv')
+dfnz = pd.read_feather('New_Zealand_Mobility_Report.feather')
 dfnz.head(3)
 
 
@@ -329,15 +379,15 @@ dfnz.head(3)
 # ### Changing the date column in a proper date-time format ###
 # 
 # 
-# We should change the date column in a proper date format. This allows us select rows on the basis of dates. 
+# We need the date column in a proper date format. This allows us select rows on the basis of dates. 
+# 
+# We already took care of that when we read the data (`parse_dates=['date']`). If you have a data set with dates stored as text, use `dfnz['Date'] = pd.to_datetime(dfnz['Date'], format='%Y-%m-%d')`. 
 # 
 # We set the date column as index:
 
 # In[ ]:
 
 
-dfnz['Date']= pd.to_datetime(dfnz['Date'])
-
 dfnz.set_index('Date', inplace=True) # This is equivalent to dfnz = dfnz.set_index('date'). 
                                      # The `inplace` parameter allows for shorter writing.
 
@@ -399,15 +449,16 @@ dfnz_june.describe()
 
 # ---
 # 
-# We may want to use only complete cases, or exclude rows with missing data on some variables.
+# We may want to use only complete cases, or exclude rows with missing data on some variables. 
+# 
+# Most Pandas methods return a new data frame, and leave the original alone. So there is no need to make a copy first: that would copy the data twice.
 # 
 # - In that case we use `dropna()`
 
 # In[ ]:
 
 
-dfnz_dropna_demo = dfnz_june.copy()  # First make a copy* from an original dataframe. 
-dfnz_dropna_demo = dfnz_dropna_demo.dropna() 
+dfnz_dropna_demo = dfnz_june.dropna()  # dropna returns a new data frame*, the original stays as it is.
 dfnz_dropna_demo.describe()
 
 
@@ -429,8 +480,7 @@ dfnz_dropna_demo.describe()
 # In[ ]:
 
 
-dfnz_fillna_demo = dfnz_june.copy()    # First make a copy from an original dataframe.
-dfnz_fillna_demo.fillna(0, inplace = True)  # Now using inplace = True
+dfnz_fillna_demo = dfnz_june.fillna(0)  # Again a new data frame, no need to make a copy first.
 dfnz_fillna_demo
 
 
@@ -440,13 +490,13 @@ dfnz_fillna_demo
 # 
 # Suppose we want a data frame where we append data from, say, June to data from September.
 # 
-# We can achieve this with the `append` method:
+# We can achieve this with `pd.concat`, which glues a list of data frames together in one go. (Older versions of Pandas had an `append` method for this, but it was slow and has been removed.)
 
 # In[ ]:
 
 
 dfnz_september = dfnz.loc['2021-09']
-dfnz_combined = dfnz_june.append(dfnz_september)
+dfnz_combined = pd.concat([dfnz_june, dfnz_september])
 dfnz_combined
 
 
@@ -458,20 +508,30 @@ dfnz_combined
 
 
 
+# **Answer**: yes, slice both months straight from `dfnz` inside the list that we give to `pd.concat`:
+
+# In[ ]:
+
+
+dfnz_combined = pd.concat([dfnz.loc['2021-06'], dfnz.loc['2021-09']])
+
+
 # ---
 # 
 # ### Replacing values ###
 # 
 # Suppose we want to replace values in our data frame.
 # 
-# We can achieve this with the `replace` method. (But there are more ways of achieving this). 
-# See this [link](https://pandas.pydata.org/pandas-docs/stable/reference/api/pandas.DataFrame.replace.html) ands this [link](https://stackoverflow.com/questions/61996932/replacing-values-greater-1-in-a-large-pandas-dataframe) for more info on `replace`.
+# The general tool for this is the `replace` method, e.g. `dfr = dfr.replace(0, 1)`. See this [link](https://pandas.pydata.org/pandas-docs/stable/reference/api/pandas.DataFrame.replace.html) ands this [link](https://stackoverflow.com/questions/61996932/replacing-values-greater-1-in-a-large-pandas-dataframe) for more info on `replace`.
+# 
+# `replace` can handle lists, dictionaries, text patterns, etc., which makes it relatively slow. All our columns are numbers, so we can instead work on the NumPy array underneath the data frame (`to_numpy()`): NumPy's `putmask` replaces the values where a condition holds, in a single pass.
 
 # In[ ]:
 
 
-dfr = dfnz_september.copy()  # First make a copy from an original dataframe.
-dfr = dfr.replace(0, 1)     # Replace all zero values by one 
+arr = dfnz_september.to_numpy(copy=True)  # First make a copy from an original dataframe.
+np.putmask(arr, arr == 0, 1)  # Replace all zero values by one
+dfr = pd.DataFrame(arr, index=dfnz_september.index, columns=dfnz_september.columns)
 
 dfr.loc[dfr['Grocery and pharmacy'] == 0] # Should return no valid rows.
 
@@ -481,22 +541,26 @@ dfr.loc[dfr['Grocery and pharmacy'] == 0] # Should return no valid rows.
 # The following command allows us to replace all negative values by zero.
 # 
 # Note, this applies to the entire frame, which is fine, because non-numerical data (in this case Date) are safely tucked away in the index, and won't be affected.
+# 
+# For large arrays, [numexpr](https://github.com/pydata/numexpr) is even faster: it evaluates a formula, written as a string, in a single pass over the data, using all cores. `where(arr < 0, 0, arr)` reads as: where the value is negative use 0, otherwise keep the value.
 
 # In[ ]:
 
 
-dfpos = dfnz_september.copy()  # First make a copy from an original dataframe.
-dfpos[dfpos < 0] = 0
+import numexpr as ne
+
+arr = dfnz_september.to_numpy(copy=True)  # First make a copy from an original dataframe.
+ne.evaluate('where(arr < 0, 0, arr)', out=arr)
+dfpos = pd.DataFrame(arr, index=dfnz_september.index, columns=dfnz_september.columns)
 dfpos.min()
 
 
-# Applying this logic to a single column:
+# Applying this logic to a single column. NumPy's `maximum` compares each value with zero and keeps the larger one, in a single pass over the column:
 
 # In[ ]:
 
 
-dfpos = dfnz_september.copy()  # First make a copy from an original dataframe.
-dfpos['Workplaces'][dfpos['Workplaces']<0] = 0
+dfpos = dfnz_september.assign(Workplaces=np.maximum(dfnz_september['Workplaces'].to_numpy(), 0))  # assign returns a new data frame
 dfpos
 
 
@@ -519,8 +583,7 @@ dfpos
 # In[ ]:
 
 
-dfclip = dfnz_september.copy()  # First make a copy from an original dataframe.
-dfclip = dfclip.clip(lower=-50, upper=10)
+dfclip = dfnz_september.clip(lower=-50, upper=10)  # clip returns a new data frame
 
 
 # **Question**: Can we apply a single command to the `dfclip` data frame to display only the minimum and maximum values - this  to verify the outcome of the cell above? Hint: use [`agg`](https://pandas.pydata.org/pandas-docs/stable/reference/api/pandas.DataFrame.agg.html?highlight=agg).
@@ -577,33 +640,43 @@ s.to_frame().head(3)
 # The next code prepares the data from Github, and the returns a list properly prepared for joining. 
 # 
 # I decided to write a function that allows us to make country name lists for various languages. 
+# 
+# A small helper function fetches the list from the cloud only once per language: it saves a copy on disk (e.g. `countries_es.parquet`), and remembers the lists it already loaded (`lru_cache`). 
 
 # In[ ]:
 
 
-def intl_country_names(ctry, new_column_name):
-    # read from the cloud:
-    dfj = pd.read_csv('https://cdn.jsdelivr.net/npm/world_countries_lists@latest/data/'+ctry.lower()+'/countries.csv')
-    # convert the country codes to upper case:
-    dfj['alpha2'] = dfj['alpha2'].str.upper()  
-    # We need meaningful column names: 
-    dfj.rename(columns = {'alpha2': 'Country region code', 'name': new_column_name}, inplace=True)
-    # We need the index name to be the same as the one of the main data frame
-    dfj = dfj.set_index('Country region code')
-    # We don' t need the following colums
-    dfj.drop(['id','alpha3'], inplace=True, axis ='columns')
+import os
+from functools import lru_cache
+
+@lru_cache(maxsize=32)  # remember the tables we already fetched during this session
+def _fetch_country_table(ctry):
+    path = 'countries_' + ctry + '.parquet'
+    if os.path.isfile(path):  # fetched in an earlier session: no need to go to the cloud
+        return pd.read_parquet(path)
+    # read from the cloud, only the columns we need, and convert the country codes to upper case while reading:
+    dfj = pd.read_csv('https://cdn.jsdelivr.net/npm/world_countries_lists@latest/data/'+ctry+'/countries.csv',
+                      usecols=['alpha2', 'name'], converters={'alpha2': str.upper}, keep_default_na=False)
+    dfj.to_parquet(path, index=False)
     return dfj
 
+def intl_country_names(ctry, new_column_name):
+    dfj = _fetch_country_table(ctry.lower())
+    # We need meaningful column names, and the index name to be the same as the one of the main data frame:
+    return dfj.rename(columns = {'alpha2': 'Country region code', 'name': new_column_name}).set_index('Country region code')
+
 dfj = intl_country_names('es', 'Nombre del país')
 dfj
 
 
-# The next step is to perform the merge, which is dead easy, because we rely on `Country region code` as the key column for joining.
+# The next step is to perform the merge, which is dead easy, because we rely on `Country region code` as the key column for joining. 
+# 
+# We could use `df = df.join(dfj)`. But we only add a single column, and the index of `df` is a category (remember?) with only a few hundred distinct country codes. So we can simply `map` each country code to its name: Pandas looks up each distinct code once, instead of once for each of the millions of rows. I store the result as a category too:
 
 # In[ ]:
 
 
-df = df.join(dfj)  
+df['Nombre del país'] = df.index.map(dfj['Nombre del país']).astype('category')
 
 
 # In[ ]:
@@ -643,7 +716,7 @@ dfnz.head(3)
 # Again, this shows the power of indexing: You can 'hide' columns that you do not want to be affected by an operation in the index. Once you are done, you reset the index (by way of `df.reset_index(inplace=True)`) and continue working on your data frame. 
 # 
 # Of course, you can apply an operation to a single column (or a set of columns) by selecting them as shown before:
-# `dfnz['Date'] = pd.to_datetime(dfnz['Date'])`. 
+# `dfnz['Date'] = pd.to_datetime(dfnz['Date'], format='%Y-%m-%d')`. 
 # But, if all except for a few columns should undergo the same treatment, then the approach shown above is the way to go.
 
 # ---
@@ -672,7 +745,11 @@ dfnz.resample('W').mean().plot(figsize=(10,8), title= 'Mobility data: Percentage
 # 
 # What we learned today can be combined into a single function, for which we can use the country code as an input. 
 # 
-# The start of the function checks if the data is already on disk. If not, it loads the data from the cloud.
+# The start of the function checks if the data is already on disk. If not, it loads the data from the cloud. 
+# 
+# Parquet has another advantage: the function can tell the Parquet reader which columns and which rows (`filters`) it needs. The reader skips the rest of the file, so only the data of a single country ends up in memory.
+# 
+# The cloud file is big, so the function reads it in chunks, and keeps only the rows of the country we want. That way we never hold all 8 million rows in memory.
 
 # In[ ]:
 
@@ -681,31 +758,45 @@ import pandas as pd
 import numpy as np
 import os
 
+mobility_cols = ['country_region_code', 'date',
+                 'retail_and_recreation_percent_change_from_baseline',
+                 'grocery_and_pharmacy_percent_change_from_baseline',
+                 'parks_percent_change_from_baseline',
+                 'transit_stations_percent_change_from_baseline',
+                 'workplaces_percent_change_from_baseline',
+                 'residential_percent_change_from_baseline']
+
 def arc_mobility(country_code):
-    if os.path.isfile('Global_Mobility_Report.csv.zip'):
-        fn = 'Global_Mobility_Report.csv.zip'
+    pq_path = 'Global_Mobility_Report.parquet'
+    if os.path.isfile(pq_path):
         file_location = 'Disk'
+        print(f'\nThe mobility data location: {file_location}.\n')
+        # read only the columns we need, and only the rows of our country:
+        df = pd.read_parquet(pq_path, columns=mobility_cols, filters=[('country_region_code', '=', country_code)])
     else:
-        fn = 'https://www.gstatic.com/covid19/mobility/Global_Mobility_Report.csv'
         file_location = 'Cloud'
-        
-    print(f'\nThe mobility data location: {file_location}.\n')
-    df = pd.read_csv(fn, low_memory=False)
+        print(f'\nThe mobility data location: {file_location}.\n')
+        dtypes = {x: 'float32' for x in mobility_cols if 'percent' in x}
+        dtypes['country_region_code'] = 'category'
+        # read the big file in chunks of 500,000 rows, and keep only the rows of our country:
+        chunks = pd.read_csv('https://www.gstatic.com/covid19/mobility/Global_Mobility_Report.csv',
+                             usecols=mobility_cols, dtype=dtypes, parse_dates=['date'], date_format='%Y-%m-%d',
+                             chunksize=500_000)
+        df = pd.concat([c.loc[c['country_region_code'] == country_code] for c in chunks])
 
     df.columns = [x.replace('_percent_change_from_baseline', '').replace('_', ' ').strip().capitalize() for x in df]
 
-    df = df.set_index('Country region code')
-
-    df = df.loc[country_code, 'Date':'Residential']
-    df['Date']= pd.to_datetime(df['Date'])
-  
-    df = df.reset_index().set_index('Date')
-
-    df.drop("Country region code", inplace=True, axis ='columns')
+    # All rows are from our country already, so we can set the date as index right away, 
+    # and keep the columns from 'Retail and recreation' to 'Residential'. Dates were parsed when the data was read.
+    df = df.set_index('Date').loc[:, 'Retail and recreation':'Residential']
 
     df /= 100
 
-    df.resample('W').mean().plot(figsize=(10,8), title= 'Mobility data: Change from Base line ('+ country_code + ').')
+    # Weekly averages, like df.resample('W').mean(), but with simple integer arithmetic on the dates:
+    days = df.index.values.astype('datetime64[D]').astype('int64')  # days since 1 January 1970
+    weekly = df.groupby((days - 4) // 7).mean()  # weeks run from Monday to Sunday; 5 January 1970 was a Monday
+    weekly.index = pd.to_datetime(weekly.index.to_numpy() * 7 + 10, unit='D')  # label each week by its Sunday
+    weekly.plot(figsize=(10,8), title= 'Mobility data: Change from Base line ('+ country_code + ').')
     return df
     
 dfnz = arc_mobility('NZ')
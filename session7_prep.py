@@ -60,7 +60,9 @@ import numpy as np
 
 # For this session
 import glob # for iterating through a folder
+from concurrent.futures import ThreadPoolExecutor # to read several files at the same time
 import os # To set our working folder
+import hashlib # To name cache files after their inputs
 from pandas.tseries.offsets import MonthEnd # To set dates to the end of the month
 import yfinance as yf  # This gets us prices from Yahoo finance. See https://pypi.org/project/yfinance/
 
@@ -88,10 +90,29 @@ bank_list = ['AAIC', 'ABCB', 'ABCW', 'ABTX', 'ACBI', 'ACFC', 'ACNB', 'AF', 'AI',
 print('Banks :', len(bank_list))
 
 
+# Downloading prices for hundreds of banks takes a while. So the function below saves the prices to disk, in the [Parquet](https://parquet.apache.org/) format, the first time you run it. Next time, it reads the prices from disk instead of downloading them again, as long as you ask for the same tickers and dates. 
+# 
+# Parquet does not store multi-index columns, so the function flattens the column names first (`('Adj Close', 'BAC')` becomes `'Adj Close_BAC'`), and restores them after reading.
+
 # In[ ]:
 
 
-dfy = yf.download(bank_list, start='2019-01-01', end='2021-12-31', progress=True)
+def get_prices(tickers, start, end):
+    # The file name is made from the tickers and dates, so asking for other banks or dates downloads them anew
+    key = hashlib.md5(repr((tickers, start, end)).encode()).hexdigest()
+    path = f'yf_{key}.parquet'
+    if os.path.exists(path):
+        df = pd.read_parquet(path)
+        df.columns = pd.MultiIndex.from_tuples([tuple(x.split('_', 1)) for x in df.columns])
+        return df
+    # threads: download many tickers at the same time; auto_adjust=False keeps the 'Adj Close' column
+    df = yf.download(tickers, start=start, end=end, progress=True, threads=min(32, len(tickers)), auto_adjust=False)
+    df_flat = df.copy()
+    df_flat.columns = ['_'.join(x) for x in df.columns]
+    df_flat.to_parquet(path, compression='zstd')
+    return df
+
+dfy = get_prices(bank_list, start='2019-01-01', end='2021-12-31')
 
 
 # **Note that `dfy` has a multi-index set of columns**
@@ -104,12 +125,12 @@ dfy = yf.download(bank_list, start='2019-01-01', end='2021-12-31', progress=True
 dfy.head()
 
 
-# We only need `Adj Close`:
+# We only need `Adj Close`. Prices and returns do not need 15 digits of precision, so I store them as `float32`, which halves the memory use:
 
 # In[ ]:
 
 
-df_close = dfy['Adj Close'].copy()
+df_close = dfy['Adj Close'].astype('float32')  # astype returns a new data frame, so no need for copy()
 df_close.head(5)
 
 
@@ -149,15 +170,18 @@ df_close.tail(5)
 # - The main date variable should be named `datadate`.
 # - The price variable should be renamed to `prc`.
 # 
-# To reshape the data frame we use `melt`, see [Session 6](https://martien.netlify.app/slides/session6/). 
+# To reshape the data frame we could use `melt`, see [Session 6](https://martien.netlify.app/slides/session6/). But here the tickers are the column names, and the dates are the index. For such a frame `stack` is the natural choice: it moves the column names into the index, and returns a long Series. 
+# 
+# Before stacking I name the index (`datadate`) and the columns (`ticker`) using `rename_axis`, so that we do not need to rename anything afterwards. Many banks have no prices on many days, so I drop the empty cells. 
+# 
+# Each ticker now appears on hundreds of rows. Storing the tickers as a `category` keeps each ticker string only once, and makes grouping and indexing on tickers faster.
 
 # In[ ]:
 
 
-# Melt
-dfm = pd.melt(df_close.reset_index(), id_vars=['Date'], var_name='ticker', value_name='prc')
-dfm.dropna(inplace=True)
-dfm.rename(columns = {'Date': 'datadate'} , inplace=True)
+# Stack
+dfm = df_close.rename_axis(index='datadate', columns='ticker').stack().dropna().rename('prc').reset_index()
+dfm['ticker'] = dfm['ticker'].astype('category')  # a few hundred tickers, repeated many times
 dfm.head()
 
 
@@ -166,9 +190,10 @@ dfm.head()
 
 # Adding additional date variables using datadate 
 
-dfm['year']       = dfm.datadate.dt.year
-dfm['quarter_no'] = dfm.datadate.dt.quarter
-dfm['quarter']    = pd.PeriodIndex(dfm.datadate, freq='Q')  # See https://stackoverflow.com/questions/50459301/how-to-convert-dates-to-quarters-in-python
+dates = pd.DatetimeIndex(dfm['datadate'])  # a DatetimeIndex gives direct access to the date parts
+dfm['year']       = dates.year
+dfm['quarter_no'] = dates.quarter
+dfm['quarter']    = dates.to_period('Q')  # See https://stackoverflow.com/questions/50459301/how-to-convert-dates-to-quarters-in-python
 
 dfm.set_index(['ticker', 'datadate'], inplace=True)
 
@@ -290,15 +315,20 @@ df_boa_ret_ann.plot(kind='bar')
 # 
 # **Applying the same logic for all banks**
 # 
-# We generally work with panel data. So, instead of lifting the data from a single firm, we should be able to apply the same approach to all banks in our data frame `dfm`. This involves the use of `groupby`, see also [Session 6](https://github.com/blucap/EEA_Python_Primer/blob/master/assignment_1_solutions.ipynb).
+# We generally work with panel data. So, instead of lifting the data from a single firm, we should be able to apply the same approach to all banks in our data frame `dfm`. This could be done using `groupby`, see also [Session 6](https://github.com/blucap/EEA_Python_Primer/blob/master/assignment_1_solutions.ipynb): `dfm['prc'].groupby('ticker').pct_change() + 1`. 
 # 
-# - Let's add a variable `dprc` to our main data frame `dfm`
+# But the *wide* frame `df_close` already has a column per bank, so `pct_change` handles all banks in one go, without splitting the data into hundreds of groups. 
+# 
+# - Let's compute the price changes (plus one) on the wide frame, `dprc_wide`. Forward filling (`ffill`) makes sure that a price is compared with the previous available price of the same bank; `where` keeps only the days with a price.
+# - Then `stack` the result and add it as a variable `dprc` to our main data frame `dfm`
 # - Then get rid of rows without valid value change observations
 
 # In[ ]:
 
 
-dfm['dprc'] = dfm['prc'].groupby('ticker').pct_change() + 1
+prc_wide = df_close.rename_axis(index='datadate', columns='ticker')
+dprc_wide = prc_wide.ffill().pct_change(fill_method=None).add(1).where(prc_wide.notna())
+dfm['dprc'] = dprc_wide.stack().reorder_levels(['ticker', 'datadate']).reindex(dfm.index)
 dfm['dprc'].head()
 
 
@@ -329,11 +359,14 @@ df_3_bks = dfm['dprc'].loc[['BAC', 'WFC', 'C']].unstack()
 df_3_bks
 
 
+# Better to transpose (T) the frame and eliminate empty rows: `dfm['dprc'].loc[['BAC', 'WFC', 'C']].unstack().T.dropna(how = 'all')`. 
+# 
+# But we already have the price changes in wide format, `dprc_wide`, so we can simply select the three columns and eliminate empty rows:
+
 # In[ ]:
 
 
-# Better to transpose (T) the frame and eliminate empty rows
-df_3_bks = dfm['dprc'].loc[['BAC', 'WFC', 'C']].unstack().T.dropna(how = 'all')
+df_3_bks = dprc_wide[['BAC', 'WFC', 'C']].dropna(how = 'all')
 df_3_bks
 
 
@@ -347,21 +380,17 @@ df_3_bks.cumprod().plot()
 # 
 # Likewise, if you want the cumulative returns per quarter:
 # 
-# - Create a group object which groups on `['ticker', 'quarter']`.
-# - Calculate the cumulative returns per quarter using Pandas product function, then deduct 1.
+# - We could create a group object which groups on `['ticker', 'quarter']`, i.e. `dfm.groupby(['ticker', 'quarter'])`. But, as with `dprc`, it is faster to use the wide frame `dprc_wide`, and `resample` it to quarters, for all banks in one go.
+# - Calculate the cumulative returns per quarter using Pandas product function, then deduct 1. `min_count=1` leaves quarters without any price empty, instead of reporting a zero return.
+# - Turn the quarter-end dates into quarters (`to_period`), and `stack` the frame, so that we get the same `['ticker', 'quarter']` index as `dfm`.
 # - If we want to: reshape the resulting frame and plot.
 
 # In[ ]:
 
 
-dfm_qtr_qp = dfm.groupby(['ticker', 'quarter'])
-dfm_qtr_qp.head()
-
-
-# In[ ]:
-
-
-df_all_bks = dfm_qtr_qp['dprc'].prod() - 1
+df_all_bks = dprc_wide.resample('Q').prod(min_count=1).sub(1)
+df_all_bks = df_all_bks.to_period('Q').rename_axis(index='quarter').stack().dropna()
+df_all_bks = df_all_bks.reorder_levels(['ticker', 'quarter']).sort_index().rename('dprc')
 df_all_bks.head(5)
 
 
@@ -406,7 +435,9 @@ df_all_bks.tail(3)
 # 
 # We now will use the downloaded BHC data, see the top of this notebook, to prepare the accounting data.
 # 
-# The function below relies on [Assignment 1](https://github.com/blucap/EEA_Python_Primer/blob/master/assignment_1_solutions.ipynb). It sorts out the accounting data in one go.
+# The function below relies on [Assignment 1](https://github.com/blucap/EEA_Python_Primer/blob/master/assignment_1_solutions.ipynb). It sorts out the accounting data in one go. 
+# 
+# Like the price data, the function saves its result to disk in the Parquet format (`bhc_<code>.parquet`), and reads that file next time, instead of the zip files. The code in the file name is made from the names and dates of the zip files, so adding or replacing a zip file makes the function read them again.
 
 # In[ ]:
 
@@ -418,13 +449,27 @@ def load_bhc_data():
             'BHCK3210': 'Total Equity Capital',
             'BHCK2170': 'Total Assets',
             'BHCK4340': 'Net Income'}
+    # Processed before? Then read the result from disk. The file name changes when a zip file is added or updated,
+    # so the data is processed again in that case.
+    files = sorted(glob.glob('BHCF*.ZIP'))
+    key = hashlib.md5(repr([(f, os.path.getmtime(f)) for f in files]).encode()).hexdigest()
+    path = f'bhc_{key}.parquet'
+    if os.path.exists(path):
+        return pd.read_parquet(path), mdrm
     var_list = [key for key, value in mdrm.items()]
-    df = pd.DataFrame()
-    for fname in glob.glob('BHCF*.ZIP'):
+    # Telling Pandas the data types saves it from guessing them: float32 is precise enough for equity and net income,
+    # and int32 is big enough for the bank ids and the dates (e.g. 20211231)
+    dtypes = {'RSSD9999': 'int32', 'RSSD9001': 'int32', 'RSSD9010': 'str',
+              'BHCK3210': 'float32', 'BHCK2170': 'float64', 'BHCK4340': 'float32'}
+    def read_bhcf(fname):
         print(fname)
-        df = df.append(pd.read_csv(fname, sep='^', encoding="ISO-8859-1", low_memory=False))
-    df = df[var_list]
+        return pd.read_csv(fname, sep='^', encoding="ISO-8859-1", usecols=var_list, dtype=dtypes, engine='c')
+    # read the zip files at the same time, one thread per file, and glue the data frames together in one go
+    with ThreadPoolExecutor(max_workers=max(1, len(files))) as ex:
+        frames = list(ex.map(read_bhcf, files))
+    df = pd.concat(frames, ignore_index=True)
     # Create a date variable that matches the price data panel.
+    # There are only a few reporting dates: by default, to_datetime converts each of them only once
     df['datadate'] = pd.to_datetime(df['RSSD9999'], format = '%Y%m%d')
     df.set_index(['RSSD9001' , 'datadate'], inplace=True)
     # Get rid of rows without the relevant accounting data:
@@ -432,6 +477,7 @@ def load_bhc_data():
     print(f'\nDone!\n\nTotal rows in data frame: {len(df)}')
     print(f'Total variables in data frame: {len(list(df))}\n')
     df.sort_index(inplace = True) # sort along the index
+    df.to_parquet(path, compression='zstd')  # save the result for the next run
     return df, mdrm
 
 df, mdrm = load_bhc_data()
@@ -455,14 +501,15 @@ df.tail(3)
 # The next cells 
 # 
 # - load a file from disk that allows you to link the bank ids `RSSD9001` to the `ticker` data,
-# - join that data with data frame `df`. To perform this join, we should reset the index and set it to match on ticker and date,
-# - eliminate rows without ticker,
-# - and finally resets the index to its previous state, with index `['RSSD9001', 'datadate']`.
+# - join that data with data frame `df`. The index of `df` has two levels, `['RSSD9001', 'datadate']`, while the index of the ticker data has only one, `RSSD9001`. With `on='RSSD9001'` we tell Pandas to join on that level of the index, so there is no need to reset the index,
+# - eliminate rows without ticker. An *inner* join (`how='inner'`) keeps only the rows that appear in both frames, so it takes care of this step as well.
+# 
+# It is good practice to spell out how you join (`how=...`): the default differs between `join` and `merge`. `sort=False` saves Pandas from sorting the result.
 
 # In[ ]:
 
 
-dft_r = pd.read_csv('ticker_rssd.csv').set_index(['RSSD9001'])
+dft_r = pd.read_csv('ticker_rssd.csv', dtype={'RSSD9001': 'int32', 'ticker': 'category'}).set_index(['RSSD9001'])
 
 
 # In[ ]:
@@ -474,14 +521,7 @@ dft_r.head()
 # In[ ]:
 
 
-df = df.reset_index().set_index(['RSSD9001']).join(dft_r).dropna(subset=['ticker'])
-df.head()
-
-
-# In[ ]:
-
-
-df = df.reset_index().set_index(['RSSD9001', 'datadate'])
+df = df.join(dft_r, on='RSSD9001', how='inner', sort=False)  # inner: keep only banks with a ticker
 df.head(3)
 
 
@@ -539,23 +579,17 @@ boa.shift(3, freq = 'M')
 # 
 # **Now let's apply this for the entire dataframe:**
 
-# **Step 1**: make sure we set the proper (Datetime) Index
-
-# In[ ]:
-
-
-df = df.reset_index().set_index(['datadate'])
-df.head(3)
-
-
-# **Step 2**: group by bank (`RSSD9001`) and apply `shift` to the accounting variables only: Equity, Total Assets, Net Income (`BHCK3210`, `BHCK2170`, `BHCK4340`). 
+# **Step 1**: apply the shift to the accounting variables only: Equity, Total Assets, Net Income (`BHCK3210`, `BHCK2170`, `BHCK4340`). 
+# 
+# We could reset the index to `datadate`, group by bank (`RSSD9001`), and apply `shift(3, freq = 'M')` per bank. But there is a shortcut. Shifting by three months simply means that every date moves three months ahead. The dates are a level of the index, and Pandas stores each distinct date of a level only once, in `df.index.levels`. So we only need to shift a dozen dates, using `MonthEnd(3)`, and no groups at all.
 # 
 # Assign the result to a data frame `df_lag`.
 
 # In[ ]:
 
 
-df_lag = df.groupby(['RSSD9001'])[['BHCK3210', 'BHCK2170', 'BHCK4340']].shift(3, freq = 'M')
+lag_dates = df.index.levels[1] + MonthEnd(3)  # level 1 is datadate
+df_lag = df[['BHCK3210', 'BHCK2170', 'BHCK4340']].set_axis(df.index.set_levels(lag_dates, level='datadate'))
 df_lag.head()
 
 
@@ -566,16 +600,15 @@ df_lag.head()
 df[['BHCK3210', 'BHCK2170', 'BHCK4340']].head()
 
 
-# **Step 3**: join both frames, and use `_lag` as a suffix, to properly name the variables.
+# **Step 2**: join both frames, and use `_lag` as a suffix, to properly name the variables.
 # 
-# But first reset the index of the main data frame to `['RSSD9001', 'datadate']`. Else we cannot join on the two dimensions.
+# Both frames have the same index, `['RSSD9001', 'datadate']`, so we can join on the two dimensions right away.
 #     
 
 # In[ ]:
 
 
-df = df.reset_index().set_index(['RSSD9001', 'datadate'])
-dfj = df.join(df_lag, rsuffix='_lag')
+dfj = df.join(df_lag, how='left', rsuffix='_lag', sort=False)
 dfj.head()
 
 
@@ -591,16 +624,15 @@ dfj.head()
 # Load the data
 df, mdrm = load_bhc_data()
 # Load the tickers
-dft_r = pd.read_csv('ticker_rssd.csv').set_index(['RSSD9001'])
+dft_r = pd.read_csv('ticker_rssd.csv', dtype={'RSSD9001': 'int32', 'ticker': 'category'}).set_index(['RSSD9001'])
 # join the tickers
-df = df.reset_index().set_index(['RSSD9001']).join(dft_r).dropna(subset=['ticker'])
-# set the index
-df = df.reset_index().set_index(['RSSD9001', 'datadate'])
+df = df.join(dft_r, on='RSSD9001', how='inner', sort=False)  # inner: keep only banks with a ticker
 
 # Do the shift - create and add lagged variables
-df_lag = df.reset_index().set_index(['datadate']).groupby(['RSSD9001'])[['BHCK3210', 'BHCK2170', 'BHCK4340']].shift(3, freq = 'M')
+lag_dates = df.index.levels[1] + MonthEnd(3)
+df_lag = df[['BHCK3210', 'BHCK2170', 'BHCK4340']].set_axis(df.index.set_levels(lag_dates, level='datadate'))
 
-dfj = df.join(df_lag, rsuffix='_lag')
+dfj = df.join(df_lag, how='left', rsuffix='_lag', sort=False)
 
 
 # In[ ]:
@@ -624,9 +656,10 @@ dfj.head(8)
 # In[ ]:
 
 
-dfj['mu_equity'] = dfj[['BHCK3210', 'BHCK3210_lag']].mean(axis=1, skipna=False)
+# The average of two columns: simply add them and divide by two. If one of them is empty, so is the average.
+dfj['mu_equity'] = (dfj['BHCK3210'].to_numpy() + dfj['BHCK3210_lag'].to_numpy()) * 0.5
 
-dfj['roe']  = dfj['BHCK4340'] / dfj['mu_equity']
+dfj['roe']  = dfj['BHCK4340'].to_numpy() / dfj['mu_equity'].to_numpy()
 
 roe = dfj['roe'].groupby('datadate').mean()
 roe
@@ -656,8 +689,7 @@ roe.resample('A-MAR').last().plot(kind = 'bar')
 # 
 # We can solve this by 
 # 
-# - taking the difference in net income `BHCK4340` per year, bank. Then store the differences in a separate data frame (`dfo`), in a separate column `BHCK4340_q`;
-# - join that data frame with the main frame (`dfj`);
+# - taking the difference in net income `BHCK4340` per year, bank, and storing the differences in a separate column `BHCK4340_q`;
 # - then add the first quarter values of `BHCK4340` to `BHCK4340_q`
 # - then create a new `roe` column.
 # 
@@ -668,12 +700,11 @@ roe.resample('A-MAR').last().plot(kind = 'bar')
 # In[ ]:
 
 
-# Add `year`, and `quarter_no` to dfj
-dfj.reset_index(inplace=True)
-dfj['year'] = dfj.datadate.dt.year
-dfj['quarter_no'] = dfj.datadate.dt.quarter
-dfj['quarter'] = pd.PeriodIndex(dfj['datadate'], freq='Q') # Let's do this one as well 
-dfj.set_index(['RSSD9001', 'datadate'], inplace = True)
+# Add `year`, and `quarter_no` to dfj, using the dates in the index, so there is no need to reset the index
+dates = dfj.index.get_level_values('datadate')
+dfj['year'] = dates.year
+dfj['quarter_no'] = dates.quarter
+dfj['quarter'] = dates.to_period('Q') # Let's do this one as well 
 
 
 # In[ ]:
@@ -682,19 +713,27 @@ dfj.set_index(['RSSD9001', 'datadate'], inplace = True)
 dfj.tail(8)
 
 
-# In[ ]:
-
-
-# using diff to create first differences by bank and year
-dfo = dfj.groupby(['RSSD9010', 'year'])['BHCK4340'].diff(1).to_frame()
-dfo
-
+# We could use `groupby` and `diff`, i.e. `dfj.groupby(['RSSD9010', 'year'])['BHCK4340'].diff(1)`, store the result in a separate data frame, and join it with `dfj`. 
+# 
+# But there is a faster way, using NumPy. If we sort the rows by bank, year, and quarter, the difference is simply the value in a row minus the value in the row above it, for all rows in one go. We only need to empty the differences in the first row of each bank-year, because there the row above belongs to another bank or year.
 
 # In[ ]:
 
 
-# Join dfo with dfj
-dfj = dfj.join(dfo, rsuffix='_q')
+# using NumPy to create first differences by bank and year
+bank = pd.factorize(dfj['RSSD9010'])[0]  # bank names as numbers (-1 for a missing name)
+year = dfj['year'].to_numpy()
+order = np.lexsort((dfj['quarter_no'].to_numpy(), year, bank))  # row order when sorted by bank, year, quarter
+ni = dfj['BHCK4340'].to_numpy()[order]
+diff = np.empty_like(ni)
+diff[0] = np.nan
+diff[1:] = ni[1:] - ni[:-1]
+new_group = (bank[order][1:] != bank[order][:-1]) | (year[order][1:] != year[order][:-1])
+diff[1:][new_group] = np.nan  # first row of each bank-year: no difference
+ni_q = np.empty_like(diff)
+ni_q[order] = diff  # put the differences back in the original row order
+ni_q[bank == -1] = np.nan  # banks without a name form no group, as with groupby
+dfj['BHCK4340_q'] = ni_q
 
 
 # In[ ]:
@@ -707,7 +746,8 @@ dfj.head(8)
 
 
 # For first quarter rows, copy the values from BHCK4340 to BHCK4340_q
-dfj.loc[dfj["quarter_no"]==1,'BHCK4340_q'] = dfj.loc[dfj["quarter_no"]==1,'BHCK4340'] 
+# np.where(condition, a, b) picks from a where the condition holds, else from b
+dfj['BHCK4340_q'] = np.where(dfj['quarter_no'].to_numpy() == 1, dfj['BHCK4340'].to_numpy(), dfj['BHCK4340_q'].to_numpy())
 dfj
 
 
@@ -753,7 +793,7 @@ dfj.head(3)
 # In[ ]:
 
 
-dfj = dfj.join(df_all_bks)
+dfj = dfj.join(df_all_bks, how='left', validate='m:1', sort=False)  # each ticker-quarter has one return
 
 
 # In[ ]:
@@ -58,6 +58,7 @@ import numpy as np
 import os
 # For this session
 from pandas.tseries.offsets import MonthEnd
+from functools import lru_cache
 
 if os.name=='nt':  # for Windows users
     os.chdir('D:/users/my_user_name_here/EAA_python/data/')  # note the forward slashes, change 'martien' to your user name
@@ -66,33 +67,71 @@ else:
        
 # Set the file name:
 fn = 'EBA Interactive Dashboard - Q3 2021 - Protected.xlsm'
+# Alternatively, skip the download and let the code below read the file straight from the EBA website:
+# fn = 'https://www.eba.europa.eu/sites/default/documents/files/document_library/Risk%20Analysis%20and%20Data/Risk%20dashboard/Q3%202021/1025834/EBA%20Interactive%20Dashboard%20-%20Q3%202021%20-%20Protected.xlsm'
 
 # For better graphs
 def set_xmargin(ax, left=0.0, right=0.3):
     ax.set_xmargin(0)
     ax.autoscale_view()
     lim = ax.get_xlim()
-    delta = np.diff(lim)
+    delta = lim[1] - lim[0]
     left = lim[0] - delta * left
     right = lim[1] + delta * right
     ax.set_xlim(left, right)
 
-# To create data frames with definitions we need these functions:
+# The Excel file is big. To avoid opening it again for each sheet, I open it once, and let the functions below reuse it.
+# The calamine engine (`pip install python-calamine`, pandas 2.2 or later) reads Excel files much faster than the default openpyxl engine.
+# It is not part of the standard Anaconda installation, so I only use it when it is installed:
+
+from importlib.util import find_spec
+excel_engine = 'calamine' if find_spec('python_calamine') else None
+
+from io import BytesIO
+from urllib.parse import unquote
+import hashlib
+import requests
+
+@lru_cache(maxsize=None)
+def workbook(fn):
+    if fn.startswith(('http://', 'https://')):
+        r = requests.get(fn)
+        r.raise_for_status()  # stop here if the download failed, rather than handing an error page to Excel
+        fn = BytesIO(r.content)  # keep the downloaded file in memory, instead of saving it to disk first
+    return pd.ExcelFile(fn, engine=excel_engine)
+
+# Reading Excel is slow. The first time, this function saves each sheet in the Parquet format 
+# (e.g. 'EBA Interactive Dashboard - Q3 2021 - Protected.Data.1a2b3c4d.parquet'), next time it reads that file instead,
+# unless the Excel file has changed since. The short code in the name comes from the options (such as `usecols`), 
+# so reading the same sheet with other options creates another file:
+
+def load_sheet_cached(fn, sn, **kwargs):
+    key = hashlib.md5(repr(sorted(kwargs.items())).encode()).hexdigest()[:8]
+    cache = os.path.splitext(unquote(os.path.basename(fn)))[0] + '.' + sn + '.' + key + '.parquet'  # also works for a url
+    is_url = fn.startswith(('http://', 'https://'))
+    if os.path.exists(cache) and (is_url or os.path.getmtime(cache) >= os.path.getmtime(fn)):
+        return pd.read_parquet(cache)
+    df = pd.read_excel(workbook(fn), sheet_name=sn, **kwargs)
+    df.columns = [str(x) for x in df]  # Parquet wants text column names
+    obj_cols = df.select_dtypes(include='object').columns
+    df[obj_cols] = df[obj_cols].astype(str).where(df[obj_cols].notna())  # Parquet wants a single type per column
+    df.to_parquet(cache, compression='zstd')
+    return df
 
-def clean_text(s):
-    return s.replace('\n', ' ').strip() # Get rid of line breaks and trim leading and lagging spaces. 
+# To create data frames with definitions we need these functions.
+# The .str methods work on the whole column at once: get rid of line breaks and trim leading and lagging spaces.
 
 def annex_data_definitions(fn, sn):
-    df = pd.read_excel(fn, sheet_name=sn, usecols='A,C', skiprows=[0]).dropna()
+    df = load_sheet_cached(fn, sn, usecols='A,C', skiprows=[0]).dropna()
     df.columns=['Label','Item']
-    df['Item'] = df['Item'].apply(clean_text)
+    df['Item'] = df['Item'].str.replace('\n', ' ', regex=False).str.strip()
     df.set_index('Label', inplace=True)
     #print(df.head(3))  #print(df.to_markdown())
     return df
 
 def ri_data_definitions(fn, sn):
-    df = pd.read_excel(fn, sheet_name=sn, usecols='D:E', skiprows=[0]).dropna()
-    df['Dashboard name'] = df['Dashboard name'].apply(clean_text)    
+    df = load_sheet_cached(fn, sn, usecols='D:E', skiprows=[0]).dropna()
+    df['Dashboard name'] = df['Dashboard name'].str.replace('\n', ' ', regex=False).str.strip()
     df.rename(columns = {'Risk Indicator code': 'Label', 'Dashboard name': 'Item'} , inplace=True)
     df.set_index('Label', inplace=True)
     #print(df.head(3))  #print(df.to_markdown())
@@ -100,42 +139,54 @@ def ri_data_definitions(fn, sn):
 
 # To create frames with data we use these functions:
 
+def to_quarter(dates):
+    # The dates look like 202109 (YYYYMM), and there are only a few dozen different ones. 
+    # So I convert each different date only once, then look up the quarter for each row.
+    codes, uniq = pd.factorize(dates)
+    quarters = (pd.to_datetime(uniq, format='%Y%m') + MonthEnd(0)).to_period('Q')
+    return quarters[codes]
+
 def read_risk_indicators(fn, sn):
-    df = pd.read_excel(fn, sheet_name=sn, usecols='AF:BI', skiprows=[0])
+    df = load_sheet_cached(fn, sn, usecols='AF:BI', skiprows=[0])
     df.set_index('Name', inplace=True)
     df.columns = [str(x) if isinstance(x, int) else x.split('.')[0] for x in df]
-    df = df.apply(pd.to_numeric,  errors='coerce')
-    df.reset_index(inplace=True)
-    df[['Country', 'Variable']] = df['Name'].str.split('_', 1, expand=True).rename(columns={0: 'Country', 1: 'Variable'})
-    df = df.drop('Name', axis=1)
-    df = df.loc[df['Country']!='EU']
-    eu_ctrys = sorted(list(set(df['Country'].tolist())))  # let's get a list of EU countries
-    dfm = pd.melt(df, id_vars=['Variable', 'Country'], value_vars=list(df), var_name='Date', value_name='value')
-    dfm['date'] = (pd.to_datetime(dfm['Date'], format='%Y%m') + MonthEnd(0)).dt.to_period('Q')
-    dfm.set_index(['Variable', 'Country', 'Date'], inplace=True)
-    df.set_index(['Country', 'Variable'], inplace=True)
-    dfp = pd.pivot_table(dfm.reset_index(), values="value", index=['Country', 'Date'], columns=["Variable"])
-    dfp.reset_index(level = 1, inplace=True)
-    dfp['Date'] = (pd.to_datetime(dfp['Date'], format='%Y%m') + MonthEnd(0)).dt.to_period('Q')
-    dfp.set_index(['Date'], inplace=True, append=True)
+    obj_cols = df.select_dtypes(include='object').columns  # only columns with some text in them need converting to numbers
+    df[obj_cols] = df[obj_cols].apply(pd.to_numeric, errors='coerce')
+    # Split the names, e.g. 'NL_SVC_3', into a country ('NL') and a variable ('SVC_3'). With expand=True this gives 
+    # an index with two levels, which, like a categorical, stores each country once and uses small integer codes:
+    df.index = df.index.str.split('_', n=1, expand=True).set_names(['Country', 'Variable'])
+    df = df.drop('EU', level='Country')
+    df.index = df.index.remove_unused_levels()
+    eu_ctrys = df.index.levels[0].tolist()  # let's get a (sorted) list of EU countries
+    df = df.rename_axis(columns='Date')
+    # Stack the dates into the index, once, giving one value per row, and drop the missing values
+    # (newer pandas' stack no longer drops them by itself):
+    long = df.stack().dropna()
+    # The long ('melted') frame works well with Seaborn
+    dfm = long.to_frame('value').reorder_levels(['Variable', 'Country', 'Date']).sort_index()
+    dfm['date'] = to_quarter(dfm.index.get_level_values('Date'))
+    # The panel: unstack the variables into columns
+    dfp = long.unstack('Variable')
+    dfp.index = dfp.index.set_levels(to_quarter(dfp.index.levels[1]), level='Date')
     #print(dfp.head(3))
     return df, dfm, dfp, eu_ctrys
 
 def annex_data(fn, sn):
-    df = pd.read_excel(fn, sheet_name=sn, usecols='L:M,O:AQ', na_values = 'n.a.')
+    df = load_sheet_cached(fn, sn, usecols='L:M,O:AQ', na_values = 'n.a.')
     df.rename(columns = {'lbl': 'Label', 'NSA': 'Country'} , inplace=True)
-    df = df.loc[df['Country']!='EU']
-    #df.set_index(['Label', 'Country'], inplace=True)
-    dfm = pd.melt(df, id_vars=['Label', 'Country'], value_vars=list(df), var_name='Date', value_name='value')
-    dfm.dropna(subset=['value'], inplace=True)
-    dfp = pd.pivot_table(dfm.reset_index(), values="value", index=['Country', 'Date'], columns=["Label"])
-    dfp.reset_index(level = 1, inplace=True)
-    
-    dfp['date'] = (pd.to_datetime(dfp['Date'], format='%Y%m') + MonthEnd(0)).dt.to_period('Q')
-    dfp.set_index(['date'], inplace=True, append=True)
-
-    dfm['date'] = (pd.to_datetime(dfm['Date'], format='%Y%m') + MonthEnd(0)).dt.to_period('Q')
-    dfm.set_index(['Label','Country', 'date'], inplace=True)
+    df['Country'] = df['Country'].astype('category')
+    df = df.loc[df['Country']!='EU'].assign(Country=lambda x: x['Country'].cat.remove_unused_categories())
+    df = df.set_index(['Country', 'Label']).rename_axis(columns='Date')
+    # Stack the dates into the index, once, giving one value per row, and drop the missing values
+    # (newer pandas' stack no longer drops them by itself):
+    long = df.stack().dropna()
+    # The long ('melted') frame
+    dfm = long.to_frame('value').reset_index('Date')
+    dfm['date'] = to_quarter(dfm['Date'])
+    dfm = dfm.set_index('date', append=True).reorder_levels(['Label', 'Country', 'date'])
+    # The panel: unstack the labels into columns
+    dfp = long.unstack('Label')
+    dfp.index = dfp.index.set_levels(to_quarter(dfp.index.levels[1]), level='Date').set_names('date', level='Date')
     #print(dfp.head(3))
     return df, dfm, dfp
 
@@ -227,10 +278,14 @@ dfaxp.loc['NL'].loc['2018':][['T13_1','T13_2','T13_3']].dropna(how='all').add(1)
 # In[ ]:
 
 
+# NPLs per country: drop the missing values once, and split the series by country in a dictionary
+npl = dfaxp['T22_1'].dropna()
+npl_by_ctry = {ctry: g.droplevel('Country') for ctry, g in npl.groupby(level='Country', observed=True)}
+
 # Dutch NPLs
-dfaxp.loc['NL']['T22_1'].dropna(how='all').plot(kind='bar', color='blue')
+npl_by_ctry['NL'].plot(kind='bar', color='blue')
 # German NPLs
-dfaxp.loc['DE']['T22_1'].dropna(how='all').plot(kind='bar', color='red')
+npl_by_ctry['DE'].plot(kind='bar', color='red')
 
 
 # In[ ]:
@@ -309,10 +364,8 @@ ax2.legend(loc='upper right')
 import matplotlib.dates as mdates
 
 def eu_risk_indicator_plot(data, xlabel, ctry):
-    # Get country data
-    data = data.loc[ctry].copy()  
-    # Get item data
-    data.columns = [df_ri_defs.loc[x, 'Item'] for x in data] 
+    # Get country data, and replace the codes in the column names by the items they stand for (rename returns a new frame)
+    data = data.loc[ctry].rename(columns=df_ri_defs['Item'])
 
     # Begin figure:
     fig = plt.figure(figsize=(10, 8))
@@ -383,18 +436,16 @@ ax = sns.regplot(y="PFT_21", x="SVC_3", data=dfp, scatter_kws={'s':2}, robust=Tr
 
 
 def eu_lineplot(data, xcol, xlabel, k):
-    data['value'] *= k
     fig = plt.figure(figsize=(10, 8))
     ax = fig.add_subplot(111)
-    ax = sns.lineplot(y = 'value', x = xcol, data = data, color='red')
+    # Scale a copy of the values only, so the data frame passed to the function stays unchanged:
+    ax = sns.lineplot(y = data['value'].to_numpy() * k, x = data[xcol].to_numpy(), color='red')
     ax.set_xlabel(xlabel)
     if k == 100:
         ax.set_ylabel("values are in %")
     else:
         ax.set_ylabel("")
-    ticks_loc = ax.get_yticks().tolist()
-    ax.yaxis.set_major_locator(mticker.FixedLocator(ticks_loc))
-    ax.set_yticklabels(['{:,.2f}'.format(x) for x in ticks_loc])
+    ax.yaxis.set_major_formatter(mticker.StrMethodFormatter('{x:,.2f}'))  # tick labels with two decimals
     ax.tick_params('x', labelrotation=90)
     plt.grid(linestyle="dotted", color='grey')
     set_xmargin(ax, left=0, right=0)
@@ -438,8 +489,7 @@ set_xmargin(ax, left=0, right=0)
 def eu_barplot(dfs, var_code, **kwargs):
     end    = kwargs.get('end', None) # optional variable
     start  = kwargs.get('start', None) # optional variable
-    data = dfs.loc[var_code].reset_index()
-    data['date'] = (pd.to_datetime(data['Date'], format='%Y%m') + MonthEnd(0)).dt.to_period('Q')
+    data = dfs.loc[var_code].reset_index()  # the quarters are already in the 'date' column of dfm
     data.set_index('date', inplace=True)
     data.dropna(inplace=True)
     if end:
@@ -455,7 +505,7 @@ def eu_barplot(dfs, var_code, **kwargs):
     
     # begin figure
     # This is odd, you have to first create the x-axis in sort order
-    sort_lyst = data.groupby('Country').mean().sort_values('value', ascending = False).index.to_list()
+    sort_lyst = data.groupby('Country', observed=True, sort=False)['value'].mean().sort_values(ascending = False).index.to_list()
     
     fig = plt.figure(figsize=(10, 8))
     ax = fig.add_subplot(111)
@@ -467,9 +517,7 @@ def eu_barplot(dfs, var_code, **kwargs):
                      palette="coolwarm")
     ax.set_xlabel(df_ri_defs.loc[var_code, 'Item']+ " " + x_txt)
     
-    ticks_loc = ax.get_yticks().tolist()
-    ax.yaxis.set_major_locator(mticker.FixedLocator(ticks_loc))
-    ax.set_yticklabels(['{:,.2f}'.format(x) for x in ticks_loc])
+    ax.yaxis.set_major_formatter(mticker.StrMethodFormatter('{x:,.2f}'))  # tick labels with two decimals
     ax.set_ylabel("")
     ax.tick_params('x', labelrotation=0)
     return #data.set_index('Country')
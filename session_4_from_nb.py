@@ -300,7 +300,7 @@ df.head()
 # 
 # #### Json data
 # 
-# Json data can be easily scraped from the web and included in a data frame using the normalize function. 
+# Json data can be easily scraped from the web and included in a data frame. Nested json needs the normalize function (`pd.json_normalize`), but a flat list of records, like the one below, can go straight into `pd.DataFrame`. 
 # 
 # See an exaxmple below for downloading Covid data from the Netherlands, provided by the RIVM. 
 # 
@@ -312,16 +312,19 @@ df.head()
 
 
 # importing the relevant libraries
-import json
 import requests
+try:
+    import orjson as json  # orjson (`pip install orjson`) parses json much faster than the standard json module
+except ImportError:
+    import json
 
 
 # In[23]:
 
 
 fh = requests.get("https://data.rivm.nl/covid-19/COVID-19_aantallen_gemeente_cumulatief.json")
-json_data = fh.json()
-df = pd.json_normalize(json_data)
+json_data = json.loads(fh.content)
+df = pd.DataFrame.from_records(json_data)
 
 
 # In[24]:
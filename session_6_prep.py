@@ -75,8 +75,31 @@ else:
 # Set the file name as `fn`, we will use the file a couple of times
 fn = 'EBA Interactive Dashboard - Q3 2021 - Protected.xlsm' 
 
+# Reading Excel is slow. The first time, this helper saves the sheet in the Parquet format, 
+# (e.g. 'EBA Interactive Dashboard - Q3 2021 - Protected.xlsm.Data.1a2b3c4d.parquet'), next time it reads that file instead,
+# unless the Excel file has changed since. The short code in the name comes from the options (such as `usecols`), 
+# so reading the same sheet with other options creates another file.
+# The calamine engine (`pip install python-calamine`, pandas 2.2 or later) reads Excel files much faster than the default openpyxl engine. 
+# It is not part of the standard Anaconda installation, so I only use it when it is installed:
+from importlib.util import find_spec
+import hashlib
+excel_engine = 'calamine' if find_spec('python_calamine') else None
+
+def _cached_read(fn, sn, **kwargs):
+    key = hashlib.md5(repr(sorted(kwargs.items())).encode()).hexdigest()[:8]
+    cache = f"{fn}.{sn}.{key}.parquet"
+    if os.path.exists(cache) and os.path.getmtime(cache) >= os.path.getmtime(fn):
+        df = pd.read_parquet(cache, engine='pyarrow')
+        df.columns = [int(x) if x.isdigit() else x for x in df]  # the years are numbers again, as in Excel
+        return df
+    df = pd.read_excel(fn, sheet_name=sn, engine=excel_engine, **kwargs)
+    obj_cols = df.select_dtypes(include='object').columns
+    df[obj_cols] = df[obj_cols].astype(str).where(df[obj_cols].notna())  # Parquet wants a single type per column
+    df.set_axis([str(x) for x in df], axis=1).to_parquet(cache, engine='pyarrow', compression='zstd')  # and text column names
+    return df
+
 def read_risk_indicators(fn, sn):
-    df = pd.read_excel(fn, sheet_name=sn, usecols='AF:BI', skiprows=[0])
+    df = _cached_read(fn, sn, usecols='AF:BI', skiprows=[0])
     return df
 
 df = read_risk_indicators(fn, 'Data')
@@ -183,28 +206,32 @@ df.head(8).tail(4)
 # 
 # The next challenge is to split the `Name` column into a country label and a variable name.
 # 
-# This can be done by the following method, which splits a string as follows:
+# This can be done by the following method, which splits a string at the first underscore, as follows:
 
 # In[ ]:
 
 
 s = 'EU_LIQ_17'
 print(s)
-s = s.split('_', 1)
+s = s.partition('_')
 print(s)
 
 
 # We now **apply** this approach to the `Name` column of the data frame, which requires us to reset the index. 
 # 
-# Once we reset the data frame, we split the Name column into 'Country' and 'Variable'.
+# Once we reset the data frame, we split the Name column into 'Country' and 'Variable', i.e. the first and the last part of the partition.
+# 
+# The country and variable codes repeat a lot, so we store them as `category`: each different code is stored once, and the rows hold small integer codes.
 # 
-# This method is documented [here](https://datascienceparichay.com/article/pandas-split-column-by-delimiter/).
+# This method is documented [here](https://pandas.pydata.org/docs/reference/api/pandas.Series.str.partition.html).
 
 # In[ ]:
 
 
 df.reset_index(inplace=True)
-df[['Country', 'Variable']] = df['Name'].str.split('_', 1, expand=True).rename(columns={0: 'Country', 1: 'Variable'})
+parts = df['Name'].str.partition('_')  # three columns: the country, the underscore, and the variable
+df['Country'] = parts[0].astype('category')
+df['Variable'] = parts[2].astype('category')
 
 
 # In[ ]:
@@ -233,6 +260,7 @@ df = df.drop('Name', axis=1)
 
 print(f'Before: {len(df)}')
 df = df.loc[df['Country']!='EU']
+df = df.assign(Country=df['Country'].cat.remove_unused_categories())  # otherwise 'EU' lingers as an (empty) category
 print(f'After: {len(df)}')
 
 
@@ -254,19 +282,16 @@ df
 # 
 # **The variable names are hard to interpret**
 # 
-# The next functions create a frame which we can use to lookup the data definition from the `RI database` sheet in the Excel file. I use a helper function that cleans the text of the labels. 
+# The next function creates a frame which we can use to lookup the data definition from the `RI database` sheet in the Excel file. It cleans the text of the labels.
 # 
-# Note the use of `df['Dashboard name'].apply(clean_text)`. It **applies** a function to a column on the data frame. This can also be used to apply complex numerical calculations to a column of a data frame. 
+# Note the use of `df['Dashboard name'].str.replace(...)`. The `.str` methods work on all the strings in a column at once, which is much faster than going through the column row by row. For calculations that have no ready-made method, `df['Dashboard name'].apply(my_function)` **applies** a function of your own to each value in a column. 
 
 # In[ ]:
 
 
-def clean_text(s):
-    return s.replace('\n', ' ').strip() # Get rid of line breaks and trim leading and lagging spaces. 
-
 def ri_data_definitions(fn):
-    df = pd.read_excel(fn, sheet_name='RI database', usecols='D:E', skiprows=[0]).dropna()
-    df['Dashboard name'] = df['Dashboard name'].apply(clean_text)    
+    df = _cached_read(fn, 'RI database', usecols='D:E', skiprows=[0]).dropna()
+    df['Dashboard name'] = df['Dashboard name'].str.replace('\n', ' ', regex=False).str.strip()  # Get rid of line breaks and trim leading and lagging spaces.
     df.set_index('Risk Indicator code', inplace=True)
     print(df)  #print(df.to_markdown())
     return df
@@ -327,6 +352,8 @@ dfcet = dfm.loc['SVC_3']
 
 
 # It is now easier to analyze variables in groups, more on that later.
+# 
+# **Tip:** `df.stack()` does the same in one step, without resetting the index: it moves the columns (the years) into an extra level of the index. We use it in the function below.
 
 # ---
 # 
@@ -340,18 +367,28 @@ dfcet = dfm.loc['SVC_3']
 
 
 def read_risk_indicators(fn, sn):
-    df = pd.read_excel(fn, sheet_name=sn, usecols='AF:BI', skiprows=[0])
+    df = _cached_read(fn, sn, usecols='AF:BI', skiprows=[0])
     df.set_index('Name', inplace=True)
-    df.columns = [str(x) if isinstance(x, int) else x.split('.')[0] for x in df]
-    df = df.apply(pd.to_numeric,  errors='coerce')
+    df.rename(columns=lambda x: str(x).split('.')[0], inplace=True)  # same as the list comprehension above
+    # Missing values are marked with a dot. Masking them lets us convert the whole frame at once, 
+    # to float32, which is precise enough for these ratios and takes half the memory:
+    try:
+        df = df.mask(df == '.').astype('float32')
+    except ValueError:  # some other text in the cells, so convert column by column
+        df = df.apply(pd.to_numeric, errors='coerce', downcast='float')
     df.reset_index(inplace=True)
-    df[['Country', 'Variable']] = df['Name'].str.split('_', 1, expand=True).rename(columns={0: 'Country', 1: 'Variable'})
+    parts = df['Name'].str.partition('_')
+    df['Country'] = parts[0].astype('category')
+    df['Variable'] = parts[2].astype('category')
     df = df.drop('Name', axis=1)
     df = df.loc[df['Country']!='EU']
+    df = df.assign(Country=df['Country'].cat.remove_unused_categories())
     eu_ctrys = sorted(list(set(df['Country'].tolist())))  # let's get a list of EU countries
-    dfm = pd.melt(df, id_vars=['Variable', 'Country'], value_vars=list(df), var_name='Date', value_name='value')
-    dfm.set_index(['Variable', 'Country', 'Date'], inplace=True)
     df.set_index(['Country', 'Variable'], inplace=True)
+    # Same result as melt (without the empty cells): stack moves the year columns into a third level of the index,
+    # and dropna removes the empty cells (newer pandas' stack no longer drops them by itself)
+    dfm = df.rename_axis(columns='Date').stack().dropna().to_frame('value')
+    dfm = dfm.reorder_levels(['Variable', 'Country', 'Date']).sort_index()
     return df, dfm, eu_ctrys
 
 fn = 'EBA Interactive Dashboard - Q3 2021 - Protected.xlsm'
@@ -387,7 +424,7 @@ dfm.loc['SVC_3'].groupby('Date').mean().plot(kind='bar')
 
 
 # checking CET 1 capital ratio, grouped by Country
-dfm.loc['SVC_3'].groupby('Country').mean().plot(kind='bar')
+dfm.loc['SVC_3'].groupby('Country', observed=True).mean().plot(kind='bar')  # observed: only countries that are in the data
 
 
 # --- 
@@ -66,6 +66,7 @@ import numpy as np
 # For this session
 import glob # for iterating through a folder
 import os # To set our working folder
+import hashlib # To name cache files after their inputs
 from pandas.tseries.offsets import MonthEnd # To set dates to the end of the month
 import yfinance as yf  # This gets us prices from Yahoo finance. See https://pypi.org/project/yfinance/
 
@@ -89,48 +90,60 @@ def load_bhc_data():
             'BHCK3210': 'Equity',
             'BHCK2170': 'TotalAssets',
             'BHCK4340': 'NetIncome'}
+    # Processed before? Then read the result from disk. The file name changes when a zip file or the ticker file 
+    # is added or updated, so the data is processed again in that case.
+    inputs = sorted(glob.glob('BHCF*.ZIP')) + ['ticker_rssd.csv']
+    key = hashlib.md5(repr([(f, os.path.getmtime(f)) for f in inputs]).encode()).hexdigest()
+    path = f'bhc_{key}.parquet'
+    if os.path.exists(path):
+        return pd.read_parquet(path), mdrm
     var_list = [key for key, value in mdrm.items()]
-    df = pd.DataFrame()
+    # Telling Pandas the data types saves it from guessing them: float32 is precise enough for equity and net income,
+    # and int32 is big enough for the bank ids and the dates (e.g. 20211231), see Session 7
+    dtypes = {'RSSD9999': 'int32', 'RSSD9001': 'int32', 'RSSD9010': 'str',
+              'BHCK3210': 'float32', 'BHCK2170': 'float64', 'BHCK4340': 'float32'}
+    # Read only the columns we need from each file, and combine the files in one go with concat:
+    frames = []
     for fname in glob.glob('BHCF*.ZIP'):
         print(fname)
-        df = df.append(pd.read_csv(fname, sep='^', encoding="ISO-8859-1", low_memory=False))
-    df = df[var_list]
+        frames.append(pd.read_csv(fname, sep='^', encoding="ISO-8859-1", usecols=var_list, dtype=dtypes))
+    df = pd.concat(frames, ignore_index=True)
     
     # Create a date variable that matches the price data panel.
     df['datadate'] = pd.to_datetime(df['RSSD9999'], format = '%Y%m%d')
-    df.set_index(['RSSD9001' , 'datadate'], inplace=True)
+    # Set the index once; the steps below all work with this index
+    df = df.set_index(['RSSD9001' , 'datadate']).sort_index()
     # Get rid of rows without the relevant accounting data:
     df.dropna(subset = [x for x in df if x.startswith('BHCK')], inplace=True)
-    df.sort_index(inplace = True) # sort along the index
     # read tickers
     dft_r = pd.read_csv('ticker_rssd.csv').set_index(['RSSD9001'])
-    # join the tickers
-    df = df.reset_index().set_index(['RSSD9001']).join(dft_r).dropna(subset=['ticker'])
-    # set the index
-    df = df.reset_index().set_index(['RSSD9001', 'datadate'])
-    # Do the shift - create and add lagged variables
-    df_lag = df.reset_index().set_index(['datadate']).groupby(['RSSD9001'])[['BHCK3210', 'BHCK2170', 'BHCK4340']].shift(3, freq = 'M')
+    # join the tickers on the RSSD9001 level of the index; inner: keep only banks with a ticker
+    df = df.join(dft_r, on='RSSD9001', how='inner', sort=False)
+    # Do the shift - create and add lagged variables, by moving each date of the index three months ahead (see Session 7)
+    lag_dates = df.index.levels[1] + MonthEnd(3)
+    df_lag = df[['BHCK3210', 'BHCK2170', 'BHCK4340']].set_axis(df.index.set_levels(lag_dates, level='datadate'))
     # Join lagged variables
-    dfj = df.join(df_lag, rsuffix='_lag')
+    dfj = df.join(df_lag, how='left', rsuffix='_lag', sort=False)
     
     # Add date variables to dfj
-    dfj.reset_index(inplace=True)
-    dfj['year'] = dfj.datadate.dt.year
-    dfj['quarter_no'] = dfj.datadate.dt.quarter
-    dfj['quarter'] = pd.PeriodIndex(dfj['datadate'], freq='Q') # Let's do this one as well 
-    dfj.set_index(['RSSD9001', 'datadate'], inplace = True)
+    dates = dfj.index.get_level_values('datadate')
+    dfj['year'] = dates.year
+    dfj['quarter_no'] = dates.quarter
+    dfj['quarter'] = dates.to_period('Q') # Let's do this one as well 
     
-    dfo = dfj.groupby(['RSSD9010', 'year'])['BHCK4340'].diff(1).to_frame()
-    dfj = dfj.join(dfo, rsuffix='_q')
-    
-    # For first quarter rows, copy the values from BHCK4340 to BHCK4340_q
-    dfj.loc[dfj["quarter_no"]==1,'BHCK4340_q'] = dfj.loc[dfj["quarter_no"]==1,'BHCK4340'] 
-    dfj['mu_equity'] = dfj[['BHCK3210', 'BHCK3210_lag']].mean(axis=1, skipna=False)
-    dfj['roe'] = dfj['BHCK4340_q'] / dfj['mu_equity']
+    # Net income is year-to-date: the quarterly figure is the difference with the previous quarter of the same year,
+    # except for first quarter rows, where we take BHCK4340 itself. np.where(condition, a, b) picks from a where the condition holds, else from b
+    ni_diff = dfj.groupby(['RSSD9010', 'year'], sort=False)['BHCK4340'].diff(1)  # diff keeps the row order, so no need to sort the groups
+    dfj['BHCK4340_q'] = np.where(dfj['quarter_no'].to_numpy() == 1, dfj['BHCK4340'].to_numpy(), ni_diff.to_numpy())
+    # Plain array arithmetic: no row-wise mean, no index alignment (a missing lag gives a missing average, as with skipna=False)
+    mu_equity = (dfj['BHCK3210'].to_numpy() + dfj['BHCK3210_lag'].to_numpy()) * 0.5
+    dfj['mu_equity'] = mu_equity
+    dfj['roe'] = dfj['BHCK4340_q'].to_numpy() / mu_equity
             
     print(f'\nDone!\n\nTotal rows in data frame: {len(dfj)}')
     print(f'Total variables in data frame: {len(list(dfj))}\n')
     
+    dfj.to_parquet(path, engine='pyarrow', compression='zstd')  # save the result for the next run
     return dfj, mdrm
 
 # Prepare the main data
@@ -153,24 +166,50 @@ df.head(3)
 
 import yfinance as yf
 bank_list = ['AAIC', 'ABCB', 'ABTX', 'ACBI', 'ACNB', 'AI', 'AIG', 'AMNB', 'AMP', 'ANCX', 'AROW', 'ASB', 'ASRV', 'ATLO', 'AUB', 'AUBN', 'AX', 'BAC', 'BANC', 'BANF', 'BANR', 'BCBP', 'BEN', 'BFIN', 'BFST', 'BHB', 'BHLB', 'BK', 'BKSC', 'BKU', 'BMRC', 'BMTC', 'BOH', 'BOKF', 'BPOP', 'BRKL', 'BSRR', 'BSVN', 'BUSE', 'BWB', 'BWFG', 'BY', 'C', 'CAC', 'CADE', 'CARV', 'CASH', 'CASS', 'CATC', 'CATY', 'CBAN', 'CBFV', 'CBNK', 'CBSH', 'CBTX', 'CBU', 'CCBG', 'CCNE', 'CFB', 'CFFI', 'CFFN', 'CFG', 'CFNB', 'CFR', 'CHCO', 'CHMG', 'CIT', 'CIVB', 'CIZN', 'CLBK', 'CMA', 'CNOB', 'COF', 'COLB', 'CPF', 'CSTR', 'CTBI', 'CUBI', 'CVBF', 'CVCY', 'CVLY', 'CWBC', 'CZNC', 'CZWI', 'DCOM', 'DFS', 'EBMT', 'EBTC', 'EFSC', 'EGBN', 'EMCF', 'EQBK', 'ESSA', 'EVBN', 'EVER', 'EWBC', 'FAF', 'FBC', 'FBIZ', 'FBK', 'FBMS', 'FBNC', 'FBP', 'FCB', 'FCBC', 'FCCO', 'FCCY', 'FCF', 'FCNCA', 'FFBC', 'FFIC', 'FFIN', 'FFNW', 'FFWM', 'FGBI', 'FHN', 'FIBK', 'FISI', 'FITB', 'FLIC', 'FMAO', 'FMBH', 'FMBI', 'FMNB', 'FNB', 'FNCB', 'FNLC', 'FNWB', 'FRBK', 'FRME', 'FSFG', 'FULT', 'FUNC', 'FUSB', 'GABC', 'GBCI', 'GBNK', 'GFED', 'GLBZ', 'GNBC', 'GNTY', 'GSBC', 'GWB', 'HAFC', 'HBAN', 'HBCP', 'HBMD', 'HBNC', 'HBT', 'HFWA', 'HMNF', 'HMST', 'HOMB', 'HONE', 'HOPE', 'HTBI', 'HTBK', 'HTH', 'HTLF', 'HWBK', 'HWC', 'IBCP', 'IBOC', 'IBTX', 'INBK', 'INDB', 'IROQ', 'ISBC', 'ISTR', 'JPM', 'KEY', 'KRNY', 'LARK', 'LBAI', 'LCNB', 'LEVL', 'LION', 'LKFN', 'LMST', 'LOB', 'MBCN', 'MBIN', 'MBWM', 'MCBC', 'MGYR', 'MLVF', 'MOFG', 'MPB', 'MRLN', 'MSBI', 'MTB', 'MVBF', 'MYFW', 'NBHC', 'NBN', 'NBTB', 'NCBS', 'NFBK', 'NKSH', 'NRIM', 'NTRS', 'NWBI', 'NWFL', 'NYCB', 'OBNK', 'OCFC', 'OFG', 'ONB', 'OPHC', 'OPOF', 'ORRF', 'OSBC', 'OVBC', 'OVLY', 'OZK', 'PACW', 'PB', 'PBCT', 'PBHC', 'PBIP', 'PBNC', 'PCSB', 'PEBK', 'PEBO', 'PFBX', 'PFC', 'PFG', 'PFIS', 'PFS', 'PGC', 'PKBK', 'PLBC', 'PNBK', 'PNC', 'PNFP', 'PPBI', 'PRK', 'PROV', 'PVBC', 'PWOD', 'QCRH', 'RBB', 'RBCAA', 'RBNC', 'RF', 'RJF', 'RNST', 'RRBI', 'RVSB', 'SAL', 'SASR', 'SBCF', 'SBFG', 'SBSI', 'SBT', 'SCHW', 'SEIC', 'SF', 'SFBS', 'SFNC', 'SFST', 'SHBI', 'SIFI', 'SIVB', 'SMBC', 'SMBK', 'SMMF', 'SNV', 'SPFI', 'SRCE', 'SSB', 'STBA', 'STBZ', 'STL', 'STT', 'SYBT', 'SYF', 'TBBK', 'TBK', 'TBNK', 'TCBI', 'TCBK', 'TCFC', 'TFC', 'THFF', 'TMP', 'TRMK', 'TROW', 'TRST', 'TSBK', 'TSC', 'UBCP', 'UBFO', 'UBOH', 'UBSI', 'UCBI', 'UMBF', 'UMPQ', 'UNB', 'UNTY', 'USB', 'UVSP', 'VBFC', 'VBTX', 'VLY', 'WABC', 'WAFD', 'WAL', 'WASH', 'WBS', 'WFC', 'WNEB', 'WSBC', 'WSBF', 'WSFS', 'WTBA', 'WTFC', 'WVFC', 'ZION']
-dfy = yf.download(bank_list, start='2019-01-01', end='2021-12-31', progress=True)
+
+# Downloading takes a while, so the first time the prices are saved to disk, in a Parquet file named after the 
+# tickers and dates (a different bank list or period gets a file of its own). Next time they are read from that file.
+# Parquet does not store multi-index columns, so I flatten the column names first, and restore them after reading (as in Session 7).
+
+def get_prices(tickers, start, end):
+    key = hashlib.md5(repr((tickers, start, end)).encode()).hexdigest()
+    path = f'yf_{key}.parquet'
+    if os.path.exists(path):
+        df = pd.read_parquet(path)
+        df.columns = pd.MultiIndex.from_tuples([tuple(x.split('_', 1)) for x in df.columns])
+        return df
+    # threads: download many tickers at the same time; auto_adjust=False keeps the 'Adj Close' column
+    df = yf.download(tickers, start=start, end=end, progress=True, threads=min(32, len(tickers)), auto_adjust=False)
+    df_flat = df.copy()
+    df_flat.columns = ['_'.join(x) for x in df.columns]
+    df_flat.to_parquet(path, compression='zstd')
+    return df
+
+dfy = get_prices(bank_list, start='2019-01-01', end='2021-12-31')
 dfy.dropna(axis = 1, inplace=True, how= 'all')
 df_close = dfy['Adj Close']
 
 dfm = pd.melt(df_close.reset_index(), id_vars=['Date'], var_name='ticker', value_name='prc')
 dfm.dropna(inplace=True)
 dfm.rename(columns = {'Date': 'datadate'} , inplace=True)
+dfm['ticker'] = dfm['ticker'].astype('category')  # each ticker is stored once, the rows hold small integer codes
 
 dfm['year']       = dfm.datadate.dt.year
 dfm['quarter_no'] = dfm.datadate.dt.quarter
 dfm['quarter']    = pd.PeriodIndex(dfm.datadate, freq='Q')  # See https://stackoverflow.com/questions/50459301/how-to-convert-dates-to-quarters-in-python
 
 dfm.set_index(['ticker', 'datadate'], inplace=True)
-
-dfm['dprc'] = dfm['prc'].groupby('ticker').pct_change() + 1
+dfm.sort_index(inplace=True)
+
+# Price relative to the previous row: one division over the whole column, instead of a pct_change per ticker.
+# The first row of each ticker has no previous price; there the ticker code differs from the one in the row above.
+prc = dfm['prc'].to_numpy()
+codes = dfm.index.codes[0]
+same_ticker = np.r_[False, codes[1:] == codes[:-1]]
+dfm['dprc'] = np.where(same_ticker, prc / np.r_[np.nan, prc[:-1]], np.nan)
 dfm.dropna(subset = ['dprc'], inplace=True)  # Get rid of the row witout valied value change
 
-dfm_qtr_qp = dfm.groupby(['ticker', 'quarter'])
+dfm_qtr_qp = dfm.groupby(['ticker', 'quarter'], observed=True, sort=False)  # observed: only ticker-quarters that are in the data
 
 df_all_bks = dfm_qtr_qp['dprc'].prod() - 1
 df_all_bks.head(3)
@@ -227,7 +266,7 @@ def table1(df, varlist, k, fmt):
     table = table * k
     table = table[['mean', 'min', '5%', '25%', '50%', '75%', '95%', 'max', 'std', 'count']]
     if fmt:
-        table = table.applymap("{0:,.2f}".format)
+        table = table.style.format("{:,.2f}")  # only changes how the numbers are shown, they stay numbers (see table.data)
     return(table)
 Tabel1a = table1(df, varlist, 0.001, True)
 Tabel1a
@@ -245,26 +284,25 @@ Tabel1b
 # In[ ]:
 
 
-Tabel1a.append(Tabel1a)
+pd.concat([Tabel1a.data, Tabel1a.data])
 
 
 # In[ ]:
 
 
-def table2(df, varlist, fmt=False, freq = "year"):
+def table2(df, varlist, freq = "year"):
     years = df.groupby(freq)
     table = years[varlist].mean() * 0.001
-    if fmt:
-        table = table.applymap("{0:,.2f}".format)
     table = table.join(years['TotalAssets'].count().to_frame(name='nobs'))
     table = table[varlist + ['nobs']]
     return(table)
 
-Tabel2 = table2(df, varlist, True)
+# The table keeps its numbers; we format them when we export the table: 
+Tabel2 = table2(df, varlist)
 print('\nMarkdown:\n')
-print(Tabel2.to_markdown())  
+print(Tabel2.to_markdown(floatfmt=',.2f'))  
 print('\nLatex:\n')
-print(Tabel2.to_latex())  
+print(Tabel2.to_latex(float_format='{:,.2f}'.format))  
 
 
 # ---
@@ -310,17 +348,13 @@ res.params
 
 
 def reg_result(res, fmt):
-    result = pd.DataFrame(res.params).transpose()
-    result['rsq'] = res.rsquared_adj
-    result['nobs'] = res.nobs
-    trow = pd.DataFrame(res.tvalues).transpose()
-    result = result.append(trow, sort=False)
-    prow = pd.DataFrame(res.pvalues).transpose()
-    result = result.append(prow, sort=False)
-    result.index = ['b', 't', 'p']
+    # One column each for the coefficients, t-stats, and p-values, with the variables as rows
+    result = pd.DataFrame({'b': res.params, 't': res.tvalues, 'p': res.pvalues})
+    result.loc['rsq', 'b'] = res.rsquared_adj
+    result.loc['nobs', 'b'] = res.nobs
     if fmt:
-        result = result.applymap("{0:,.2f}".format)
-    return result.T
+        result = result.style.format("{:,.2f}", na_rep='')  # as in table1: the numbers stay numbers
+    return result
 Table3 = reg_result(res, True)
 Table3
 
@@ -329,7 +363,9 @@ Table3
 # 
 # **Using R-style formulas**
 # 
-# For convenience there is a library (`statsmodels.formula.api `) that allows you to use R-style model specifications:
+# For convenience there is a library (`statsmodels.formula.api `) that allows you to use R-style model specifications.
+# 
+# The formula also takes care of the year dummies: `C(year)` treats `year` as a categorical variable, and leaves out the first year. So there is no need to create the dummies with `pd.get_dummies`:
 
 # In[ ]:
 
@@ -340,9 +376,9 @@ import statsmodels.formula.api as smf
 # In[ ]:
 
 
-data = df[['Returns', 'ROE']].join(pd.get_dummies(df['year'], prefix='Y', drop_first=True)).dropna()
+data = df[['Returns', 'ROE', 'year']].dropna()
 
-mod = smf.ols(formula='Returns ~ ROE + Y_2020 + Y_2021', data=data)
+mod = smf.ols(formula='Returns ~ ROE + C(year)', data=data)
 
 res = mod.fit() 
 
@@ -374,7 +410,8 @@ from linearmodels.panel import compare
 # In[ ]:
 
 
-data = df[['Returns', 'ROE', 'datadate', 'ID']].reset_index().set_index(['ID', 'datadate']).dropna()
+# We build the data once, sorted by bank and date, and use it for all the panel regressions below
+data = df.set_index(['ID', 'datadate'])[['Returns', 'ROE']].dropna().sort_index()
 
 
 # We can now run panel data regressions:
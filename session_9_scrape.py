@@ -91,13 +91,25 @@ from bs4 import BeautifulSoup
 from urllib.request import Request, urlopen as uReq
 import urllib.error as uErr
 import re
-from collections import OrderedDict
+from collections import OrderedDict, defaultdict
 from dateutil.parser import parse
+from datetime import datetime
 import calendar
 import tenacity
+from functools import lru_cache
+from pathlib import Path
 
-# The code below tries the SSRN site until is loads the page you need.
+# The regex patterns used below, compiled once here instead of each time the function runs
+SSRN_ID_RE = re.compile(r'abstract(_id)?=(\d+)', re.IGNORECASE)       # the SSRN id in the url
+PAGES_COUNT_RE = re.compile(r'Number of pages:\s+(\d+)', re.IGNORECASE)
+PAGES_RANGE_RE = re.compile(r'pp.\s+(\d+-\d+)', re.IGNORECASE)
+PAGES_PAGES_RE = re.compile(r'(\d+) Pages', re.IGNORECASE)
+PER_ID_RE = re.compile(r'per_id=(\d+)', re.IGNORECASE)               # the SSRN id of an author
 
+# The code below tries the SSRN site until is loads the page you need. 
+# It returns the contents of the page, which lru_cache remembers: asking for the same page again does not download it again.
+
+@lru_cache(maxsize=256)
 @tenacity.retry(wait=tenacity.wait_exponential(multiplier=1, min=4, max=64), stop=tenacity.stop_after_attempt(5))
 def get_that_page(url):
     try:
@@ -106,13 +118,27 @@ def get_that_page(url):
         print('Success')
     except Exception:
         print('Trying again.')
-    return uClient
+    return uClient.read()
+
+# Pages are also saved to disk, in a folder `.cache/ssrn` in your home folder, so that next time, e.g. when you run the script from the command prompt, 
+# the page is read from disk. Delete the file (e.g. `3197365.html`) to download the page again, e.g. when the paper got published.
+SSRN_CACHE = Path('~/.cache/ssrn').expanduser()
+
+# The code below is a helper function to get the correct month data, from a table of month abbreviations that we make once
+MONTH_ABBR = tuple(m.lower() for m in calendar.month_abbr)  # ('', 'jan', 'feb', ...)
 
-# The code below is a helper function to get the correct month data
 def get_month(m):
-    dic = dict(enumerate(calendar.month_abbr))
-    m = dic[m]
-    return m.lower()
+    return MONTH_ABBR[m]
+
+# SSRN dates look like 2018/06/26 or 2018-06-26. Parsing a known format with strptime is much faster than letting 
+# dateutil's parse figure out the format, so we only use parse for dates in another format:
+def parse_ssrn_date(s):
+    for fmt in ('%Y/%m/%d', '%Y-%m-%d'):
+        try:
+            return datetime.strptime(s, fmt)
+        except (TypeError, ValueError):
+            pass
+    return parse(s)
 
 
 # **Main code to get that reference**
@@ -128,11 +154,17 @@ def get_ssrn_entry(url):
 
     # req = Request(url, headers={'User-Agent': 'Mozilla/5.0'})
     # uClient = uReq(req)
-    uClient = get_that_page(url)
+    cache_path = SSRN_CACHE / (SSRN_ID_RE.search(url).group(2) + '.html')
+    if cache_path.exists():
+        page = cache_path.read_bytes()
+    else:
+        page = get_that_page(url)
+        SSRN_CACHE.mkdir(parents=True, exist_ok=True)
+        cache_path.write_bytes(page)
 
     # Let BeautifulSoup do its work on the downloaded page
     
-    soup = BeautifulSoup(uClient, 'lxml')
+    soup = BeautifulSoup(page, 'lxml')
     
     # Create a dictionary for the fields that we want
     
@@ -160,52 +192,53 @@ def get_ssrn_entry(url):
     
     # Pre-populate, get the SSRN id from the url
     
-    articledict['ssrn_no'] = re.search('abstract(_id)?=(\d+)', url, re.IGNORECASE).group(2)
+    articledict['ssrn_no'] = SSRN_ID_RE.search(url).group(2)
     articledict['note'] = '"\\url{https://ssrn.com/abstract=' + articledict['ssrn_no'] + '}"'
 
     
     # Here is where all the action takes place!
     # Best to open the page source of the page and search for the 'meta'-tags. These have most of the information we need
     
-    for tag in soup.find_all('meta'):
-        if tag.get("name", None) == 'citation_title':
-            # print(tag.get("content", None))
-            articledict['title'] = "{{" + tag.get("content", None) + "}}"
-            raw_title = tag.get("content", None)
-
-        if tag.get("name", None) == 'citation_online_date':
-            # print(tag.get("content", None))
-            cite_date_str = tag.get("content", None)
-            try:
-                cite_date = parse(cite_date_str)
-            except:
-                cite_date = parse("01/01/2099")
-
-        if tag.get("name", None) == 'citation_publication_date':
-            # print(tag.get("content", None))
-            try_date_str = tag.get("content", None)
-            try:
-                try_date = parse(try_date_str)
-            except:
-                try_date = cite_date
-
-
-            articledict['date_str'] = try_date_str  # tag.get("content", None)
-            articledict['date'] = try_date  # parse(articledict['date_str'])
-
-            articledict['month'] = get_month(articledict['date'].month)
-            articledict['year'] = str(articledict['date'].year)
-
-        if tag.get("name", None) == 'citation_author':
-            author = tag.get("content", None)
-            # print(author)
-            if len(author) > 0:
-                authorscount += 1
-                if authorscount == 1:
-                    first_author = author.split(',')[0]
-                if authorscount == 2:
-                    second_author = author.split(',')[0]
-                authorsstring += author + ' and '
+    # Collect the contents of the meta-tags by name, in one pass over the page. A name can occur more than once (e.g. one 'citation_author' per author), 
+    # so each name gets a list of contents.
+    metas = defaultdict(list)
+    for tag in soup.find_all('meta', attrs={'name': True}):
+        metas[tag['name']].append(tag.get("content", None))
+
+    if 'citation_title' in metas:
+        raw_title = metas['citation_title'][-1]  # [-1]: if a name occurs more than once, we take the last one
+        articledict['title'] = "{{" + raw_title + "}}"
+
+    if 'citation_online_date' in metas:
+        cite_date_str = metas['citation_online_date'][-1]
+        try:
+            cite_date = parse_ssrn_date(cite_date_str)
+        except:
+            cite_date = parse("01/01/2099")
+
+    if 'citation_publication_date' in metas:
+        try_date_str = metas['citation_publication_date'][-1]
+        try:
+            try_date = parse_ssrn_date(try_date_str)
+        except:
+            try_date = cite_date
+
+
+        articledict['date_str'] = try_date_str  # tag.get("content", None)
+        articledict['date'] = try_date  # parse(articledict['date_str'])
+
+        articledict['month'] = get_month(articledict['date'].month)
+        articledict['year'] = str(articledict['date'].year)
+
+    for author in metas.get('citation_author', []):
+        # print(author)
+        if len(author) > 0:
+            authorscount += 1
+            if authorscount == 1:
+                first_author = author.split(',')[0]
+            if authorscount == 2:
+                second_author = author.split(',')[0]
+            authorsstring += author + ' and '
     
     # Create an unique ID for the article: FusterVickery2018
 
@@ -217,24 +250,27 @@ def get_ssrn_entry(url):
         bib_entry = first_author + 'EtAl' + articledict['year']
         
     articledict['bib_entry'] = "@article{" + bib_entry
-    authorsstring = re.sub(r' and $', r"", authorsstring)  # get rid of unwanted `and`
+    if authorsstring.endswith(' and '):  # get rid of unwanted `and`
+        authorsstring = authorsstring[:-len(' and ')]
     articledict['authors'] = "{" + authorsstring + "}"
 
     pp = "0"
     # print('\n', pp)
-    pages = re.search('Number of pages:\s+(\d+)', soup.get_text(strip=True), re.IGNORECASE)
+    # Getting the text walks through the whole page, so we do that once, and search the text in three ways
+    page_text = soup.get_text(strip=True)
+    pages = PAGES_COUNT_RE.search(page_text)
     if pages != None and pp == "0":
         pp = pages.group(1)
         articledict['pages'] = "pages = {1--" + str(pp) + "}"
         articledict['pagescount'] = int(pp)
 
-    pages = re.search('pp.\s+(\d+-\d+)', soup.get_text(strip=True), re.IGNORECASE)
+    pages = PAGES_RANGE_RE.search(page_text) if pp == "0" else None
     if pages != None and pp == "0":
         pp = pages.group(1)
         articledict['pagescount'] = int(pp.split('-')[1]) - int(pp.split('-')[0])
         articledict['pages'] = "pages = {" + str(pp) + "}"
 
-    pages = re.search('(\d+) Pages', soup.get_text(strip=False), re.IGNORECASE)
+    pages = PAGES_PAGES_RE.search(soup.get_text(strip=False)) if pp == "0" else None  # this pattern needs the spaces
     if pages != None and pp == "0":
         pp = pages.group(1)
         articledict['pages'] = "pages = {1--" + str(pp) + "}"
@@ -247,35 +283,33 @@ def get_ssrn_entry(url):
     print('\n')
     authors_prefix = 'Author\'s names:\n' if authorscount > 1  else 'Author\'s name:'
     print(authors_prefix)
-    for link in soup.find_all('a', href=True):
-        dlink = link.get('title')
-        #print(dlink)
-        if dlink == "View other papers by this author":
-            #print(link.get('href'))
-            ssrn_id = re.search('per_id=(\d+)', link.get('href'), re.IGNORECASE)
-            if (ssrn_id) and (not link.get_text().startswith("See all articles")):
-                ssrn_id = int(ssrn_id.group(1))
-                if ssrn_id not in dic:
-                    dic[ssrn_id] = link.get_text()
-                    print(f'{dic[ssrn_id]} ({ssrn_id})')
-
-    print('\nBibtex:\n')
-    print(f'{articledict["bib_entry"]},')
-    print(f'author = {articledict["authors"]},')
-    print(f'title = {articledict["title"]},')
+    for link in soup.select('a[title="View other papers by this author"][href]'):
+        ssrn_id = PER_ID_RE.search(link.get('href'))
+        if (ssrn_id) and (not link.get_text().startswith("See all articles")):
+            ssrn_id = int(ssrn_id.group(1))
+            if ssrn_id not in dic:
+                dic[ssrn_id] = link.get_text()
+                print(f'{dic[ssrn_id]} ({ssrn_id})')
+
+    # Collect the lines of the bibtex entry in a list, and print them in one go
+    lines = ['\nBibtex:\n',
+             f'{articledict["bib_entry"]},',
+             f'author = {articledict["authors"]},',
+             f'title = {articledict["title"]},']
     if pp != "0":
-        print(f'{articledict["pages"]},')
-    print(f'journal = {articledict["journal"]},')
-    print(f'publisher = {articledict["publisher"]},')
-    print(f'note = {articledict["note"]},')
-    print(f'month = {articledict["month"]},')
-    print(f'year = {articledict["year"]}')
-    print('}')
-    print('\n')
-    print(url)
-    print('\n')
-
-    return articledict, soup.prettify(), dic, bib_entry
+        lines.append(f'{articledict["pages"]},')
+    lines += [f'journal = {articledict["journal"]},',
+              f'publisher = {articledict["publisher"]},',
+              f'note = {articledict["note"]},',
+              f'month = {articledict["month"]},',
+              f'year = {articledict["year"]}',
+              '}',
+              '\n',
+              str(url),
+              '\n']
+    print('\n'.join(lines))
+
+    return articledict, soup, dic, bib_entry  # the parsed page itself; call soup.prettify() only when you want to read it
 
 
 # ---
@@ -67,16 +67,13 @@ import requests
 
 
 response = requests.get('https://group.bnpparibas/uploads/file/bnp2019_urd_en_20_03_13.pdf')
-# Write content in pdf file
-pdf = open("bnp2019_urd_en_20_03_13_web.pdf", 'wb')
-pdf.write(response.content)
-pdf.close()
 
 
 # In[ ]:
 
 
-doc = fitz.open('bnp2019_urd_en_20_03_13_web.pdf')
+# PyMuPDF can open the pdf straight from the downloaded bytes, so we do not have to write it to a file first
+doc = fitz.open(stream=response.content, filetype='pdf')
 
 
 # **Find a page with some text**, e.g. the page on with `ethics of the highest standard`.
@@ -99,16 +96,14 @@ for page in doc:
 
 #Using regex instead, finding the page with the most text
 def find_long_page(search_term):
+    term = re.compile(search_term, re.IGNORECASE)  # compile the pattern once, and use it for every page
     words_page_dict = {}
     for page in doc:
         #print(page)
         s = page.get_text("text")
-        matches = re.findall(search_term,s, re.IGNORECASE)
-        if matches:
-            p = page.get_text('words')
-            df = pd.DataFrame(p)
-            # print(page.number, len(df))
-            words_page_dict[page.number] = len(df)
+        if term.search(s):  # we only need to know whether the page has the term, so we stop at the first match
+            # print(page.number, len(s.split()))
+            words_page_dict[page.number] = len(s.split())  # the number of words on the page, from the text we already have
     return(max(words_page_dict, key=words_page_dict.get))
 
 find_long_page(r'ethics of the highest standard')
@@ -182,12 +177,8 @@ stop_words = set(stopwords.words('english'))
 stop_words
 
 def words_cleanup(words, stop_words):
-    cleaned_words = []
-    # remove stopwords
-    for word in words:
-        if word not in stop_words:
-            cleaned_words.append(word)
-    return cleaned_words
+    # remove stopwords, using a list comprehension: a compact for-loop that builds the list in one go
+    return [word for word in words if word not in stop_words]
 
 cleaned_words = words_cleanup(words, stop_words)
 print(cleaned_words)
@@ -205,11 +196,7 @@ lemmatizer = PorterStemmer() #plug in here any other stemmer or lemmatiser you w
 
 # stemm or lemmatise words
 def words_lemmatizer(words):
-    stemmed_words = []
-    for word in words:
-        word = lemmatizer.stem(word)   #dont forget to change stem to lemmatize if you are using a lemmatizer
-        stemmed_words.append(word)   
-    return stemmed_words
+    return [lemmatizer.stem(word) for word in words]   #dont forget to change stem to lemmatize if you are using a lemmatizer
     
 stemmed_words = words_lemmatizer(cleaned_words)
 print(stemmed_words)
@@ -253,37 +240,47 @@ polarity_score['compound']
 # 
 # #### Bringing it all together ####
 # 
-# The function below determines the polarity score of a text:
+# The function below determines the polarity score of a text. 
+# 
+# It uses the stemmer (`lemmatizer`) and the sentiment analyzer (`sia`) that we created above. Creating them once, rather than each time the function runs, matters when we apply the function to every row of a data frame: the analyzer loads its word list from disk when it is created.
 
 # In[ ]:
 
 
 from nltk.sentiment import SentimentIntensityAnalyzer
+from functools import lru_cache
+
+# Many words occur again and again in a report. lru_cache remembers the stem of each word it has seen,
+# so every different word is stemmed only once (rerun this cell if you plug in a different stemmer):
+@lru_cache(maxsize=100_000)
+def stem(word):
+    return lemmatizer.stem(word)
+
+# A lookup table that maps every byte except a-z and A-Z to a space. Build it once, outside the function.
+# bytes.translate runs through the text in one go, which is quicker than re.sub("[^a-zA-Z]+", " ", text).
+# Characters outside ASCII (such as curly quotes) are turned into '?' by encode, and then into a space.
+letters_table = bytes(c if chr(c).isascii() and chr(c).isalpha() else ord(' ') for c in range(256))
+
+def letters_only(raw_text):
+    return raw_text.encode('ascii', 'replace').translate(letters_table).decode('ascii')
 
 def preprocess(raw_text):
-    letters_only_text =  re.sub("[^a-zA-Z]+", " ", raw_text ) # get rid everything except words, numbers, spaces
+    letters_only_text =  letters_only(raw_text) # get rid everything except words, spaces
     #text =  re.sub("\s\.\s+", ". ",text ) # get rid of space dot space
     #text =  re.sub("\s+", " ",text )  # get rid of multiple spaces
     # convert to lower case and split into words -> convert string into list ( 'hello world' -> ['hello', 'world'])
     words = letters_only_text.lower().split()
-    
-    cleaned_words = []
-    # remove stopwords
-    for word in words:
-        if word not in stop_words:
-            cleaned_words.append(word)
+    return words_score(words)
 
-    lemmatizer = PorterStemmer() # plug in here any other stemmer or lemmatiser you want to try out
+def words_score(words):
+    # remove stopwords (stop_words is a set, so checking if a word is in it is fast)
+    cleaned_words = [word for word in words if word not in stop_words]
 
     # stemm or lemmatise words
-    stemmed_words = []
-    for word in cleaned_words:
-        word = lemmatizer.stem(word)   #don't forget to change stem to lemmatize if you are using a lemmatizer
-        stemmed_words.append(word)
+    stemmed_words = [stem(word) for word in cleaned_words]   #don't forget to change stem to lemmatize if you are using a lemmatizer
 
     # converting list back to string
     pre_senti_text = " ".join(stemmed_words)
-    sia = SentimentIntensityAnalyzer()
     polarity_score =  sia.polarity_scores(pre_senti_text)
     return polarity_score['compound']
 
@@ -307,7 +304,10 @@ preprocess(df.loc[0]['full_text'])
 # In[ ]:
 
 
-# Apply the function to all entries in the data frame
-df['compound_senti_score'] = df['full_text'].apply(preprocess)
+# Apply the function to all entries in the data frame. 
+# The lookup table cleans each text, and the lower case and split steps work on the whole column at once
+# with the .str methods, so only the last steps (stopwords, stemming, and sentiment) go row by row:
+words = df['full_text'].map(letters_only).str.lower().str.split()
+df['compound_senti_score'] = words.apply(words_score)
 df.sort_values('compound_senti_score')
 